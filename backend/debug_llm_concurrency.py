@@ -0,0 +1,64 @@
+"""
+Debug script to verify that concurrent generations never interleave on the
+shared llama.cpp context (KV cache, n_tokens and grammar state).
+
+Runs two streams and one blocking completion at the same time, records which
+thread drives every llama.cpp eval call and checks that each generation's
+evals form one contiguous run.
+"""
+import threading
+import time
+from src.services.llm import LLMService
+
+PROMPTS = [
+    "Write three sentences about rivers.",
+    "List five prime numbers and explain why they are prime.",
+]
+
+
+def check_interleaving():
+    print("\n🔍 --- LLM CONCURRENCY CHECK ---")
+    llm = LLMService.get_llm()
+    model = llm._model
+
+    eval_log = []
+    original_eval = model.eval
+
+    def recording_eval(tokens):
+        eval_log.append(threading.current_thread())
+        # Widen the window in which an unserialized caller could sneak in
+        time.sleep(0.001)
+        return original_eval(tokens)
+
+    model.eval = recording_eval
+
+    def run_stream(prompt):
+        for _ in llm.stream_complete(prompt):
+            time.sleep(0.005)  # slow consumer
+
+    def run_complete():
+        time.sleep(0.05)  # start while the streams are mid-generation
+        llm.complete("Say hello in one word.")
+
+    threads = [threading.Thread(target=run_stream, args=(p,)) for p in PROMPTS]
+    threads.append(threading.Thread(target=run_complete))
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        model.eval = original_eval
+
+    # Collapse consecutive evals from the same thread into runs
+    runs = [thread for i, thread in enumerate(eval_log) if i == 0 or eval_log[i - 1] is not thread]
+    print(f"🧮 {len(eval_log)} eval calls in {len(runs)} run(s) from {len(set(eval_log))} thread(s)")
+
+    if len(runs) != len(set(runs)):
+        print("❌ CRITICAL: generations interleaved on the shared context.")
+        raise SystemExit(1)
+    print("✅ Every generation ran to completion without interleaving.")
+
+
+if __name__ == "__main__":
+    check_interleaving()
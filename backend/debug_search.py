@@ -3,22 +3,35 @@ Debug script to verify what the database is actually returning.
 This helps diagnose if the retrieval (the "Eyes") is working correctly.
 """
 import asyncio
-from src.services.query import QueryService
+import time
+from src.services.query import get_query_service
+
+async def warmup(qs, team: str):
+    """Run one throwaway search so model loads and caches don't skew timings."""
+    start = time.perf_counter_ns()
+    await qs._hybrid_search_async("warmup", team)
+    elapsed_ms = (time.perf_counter_ns() - start) / 1e6
+    print(f"🔥 Warmup search took {elapsed_ms:.1f} ms (cold)")
 
 async def debug_retrieval():
     print("\n🔍 --- DIAGNOSTIC MODE ---")
-    qs = QueryService()
-    
+    qs = get_query_service()
+
     # This query MUST be something you know is in your documents
     # Replace this string with a real question from your PDF
-    test_query = "What are the critical items?" 
+    test_query = "What are the critical items?"
     team = "engineering"
-    
+
+    await warmup(qs, team)
+
     print(f"🎯 Searching for: '{test_query}'")
-    
+
     # Run the search manually
-    results = qs._hybrid_service._hybrid_search(test_query, team)
-    
+    start = time.perf_counter_ns()
+    results = await qs._hybrid_search_async(test_query, team)
+    elapsed_ms = (time.perf_counter_ns() - start) / 1e6
+    print(f"⏱️ Search took {elapsed_ms:.1f} ms (warm)")
+
     if not results:
         print("❌ CRITICAL: No results found.")
         return
@@ -30,7 +43,7 @@ async def debug_retrieval():
         text = res.get('text', 'N/A')
         file = res.get('file_name', 'Unknown')
         page = res.get('page', '')
-        
+
         print(f"\n[{i+1}] Score: {score:.4f} | File: {file} | Page: {page}")
         print(f"    CONTENT: {text[:400]}...")
 
@@ -4,11 +4,19 @@ from pathlib import Path
 from src.services.ingestion import IngestionService
 from src.services.query import QueryService
 from src.services.auth import get_user_context_dependency, UserContext, log_request
+from src.core.config import SETTINGS
 from fastapi.middleware.cors import CORSMiddleware
-import numpy as np
+from contextlib import asynccontextmanager
+from qdrant_client import QdrantClient
+from qdrant_client.models import Filter, FieldCondition, MatchValue
+import orjson
 import json
+import asyncio
+import anyio
 import logging
 import re
+import time
+from typing import Optional
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -34,7 +42,44 @@ from openinference.instrumentation.llama_index import LlamaIndexInstrumentor
 LlamaIndexInstrumentor().instrument(tracer_provider=tracer_provider)
 logger.info("✅ LlamaIndex instrumented for Phoenix tracing")
 
-app = FastAPI(title="NEXUS RAG System")
+# --- Shared Qdrant Client ---
+# One client (and its connection pool) is reused by all team management endpoints
+qdrant_client = QdrantClient(
+    host=SETTINGS.QDRANT_HOST,
+    port=SETTINGS.QDRANT_PORT,
+    url=SETTINGS.QDRANT_URL,
+    api_key=SETTINGS.QDRANT_API_KEY
+)
+
+# Existence checks on team endpoints reuse a short-lived snapshot of collection names
+COLLECTION_CACHE_TTL = 5.0  # seconds
+_collection_names: Optional[set] = None
+_collection_names_loaded_at = 0.0
+
+def get_collection_names() -> set:
+    """Return the set of Qdrant collection names, refreshed at most every COLLECTION_CACHE_TTL seconds."""
+    global _collection_names, _collection_names_loaded_at
+    now = time.monotonic()
+    if _collection_names is None or now - _collection_names_loaded_at > COLLECTION_CACHE_TTL:
+        _collection_names = {col.name for col in qdrant_client.get_collections().collections}
+        _collection_names_loaded_at = now
+    return _collection_names
+
+def invalidate_collection_names():
+    """Drop the cached collection names (call after creating or deleting a collection)."""
+    global _collection_names
+    _collection_names = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Models are loaded at import; run them once so the first request is warm
+    await asyncio.to_thread(query_service.warmup)
+    # An ingest interrupted by a crash leaves HNSW indexing paused on its collection
+    await asyncio.to_thread(ingestion_service.restore_indexing_thresholds)
+    yield
+    qdrant_client.close()
+
+app = FastAPI(title="NEXUS RAG System", lifespan=lifespan)
 
 # --- Supported File Extensions ---
 SUPPORTED_EXTENSIONS = {
@@ -54,6 +99,9 @@ SUPPORTED_EXTENSIONS = {
     ".rtf": "Rich Text Format",
     ".json": "JSON",
 }
+SUPPORTED_EXTENSIONS_KEYS = frozenset(SUPPORTED_EXTENSIONS)
+SUPPORTED_EXTENSIONS_LIST = ", ".join(SUPPORTED_EXTENSIONS.keys())
+SUPPORTED_FILE_TYPES_LIST = ", ".join(SUPPORTED_EXTENSIONS.values())
 
 # --- Error Response Helper ---
 def create_error_response(status_code: int, error_type: str, message: str, details: str = None, suggestion: str = None):
@@ -69,7 +117,30 @@ def create_error_response(status_code: int, error_type: str, message: str, detai
         content["suggestion"] = suggestion
     return JSONResponse(status_code=status_code, content=content)
 
+# --- Reserved Team Names ---
+# Underscore-prefixed collections are internal (e.g. the answer cache), never teams
+def is_reserved_team(team: str) -> bool:
+    return team.startswith("_")
+
+def reserved_team_response(team: str):
+    """Error response for a team name that collides with an internal collection."""
+    return create_error_response(
+        status_code=400,
+        error_type="INVALID_TEAM_NAME",
+        message=f"Team name '{team}' is reserved.",
+        suggestion="Team names may not start with an underscore."
+    )
+
+# --- Response Class ---
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered by orjson, serializing numpy types natively."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
 # --- Error Classification ---
+MISSING_MODULE_PATTERN = re.compile(r"no module named ['\"]?(\w+)['\"]?")
+
 def classify_and_respond_to_error(e: Exception, context: str = "operation"):
     """
     Classifies an exception and returns a user-friendly error response.
@@ -78,7 +149,7 @@ def classify_and_respond_to_error(e: Exception, context: str = "operation"):
     original_error = str(e)
 
     # 1. Missing Dependency Errors
-    dependency_match = re.search(r"no module named ['\"]?(\w+)['\"]?", error_str)
+    dependency_match = MISSING_MODULE_PATTERN.search(error_str)
     if dependency_match or "is required" in error_str:
         missing_lib = dependency_match.group(1) if dependency_match else "a required library"
         return create_error_response(
@@ -96,7 +167,7 @@ def classify_and_respond_to_error(e: Exception, context: str = "operation"):
             error_type="UNSUPPORTED_FILE_TYPE",
             message="This file type is not supported for ingestion.",
             details=original_error,
-            suggestion=f"Supported types: {', '.join(SUPPORTED_EXTENSIONS.values())}."
+            suggestion=f"Supported types: {SUPPORTED_FILE_TYPES_LIST}."
         )
 
     # 3. Database Connection Errors (Qdrant)
@@ -181,13 +252,15 @@ async def ingest_file(
     """
     # Validate file extension before processing
     file_ext = Path(file.filename).suffix.lower()
-    if file_ext not in SUPPORTED_EXTENSIONS:
+    if file_ext not in SUPPORTED_EXTENSIONS_KEYS:
         return create_error_response(
             status_code=415,
             error_type="UNSUPPORTED_FILE_TYPE",
             message=f"The file type '{file_ext}' is not supported.",
-            suggestion=f"Supported file types: {', '.join(SUPPORTED_EXTENSIONS.keys())}"
+            suggestion=f"Supported file types: {SUPPORTED_EXTENSIONS_LIST}"
         )
+    if is_reserved_team(team):
+        return reserved_team_response(team)
 
     try:
         result = await ingestion_service.ingest_file(
@@ -196,6 +269,10 @@ async def ingest_file(
             team=team,
             chunking_strategy=chunking_strategy
         )
+        # Ingestion may have created the team's collection
+        invalidate_collection_names()
+        # New content may change answers to questions asked before
+        await query_service.invalidate_answer_cache(team)
         # Log the action
         log_request(user, "INGEST", "document", {"filename": file.filename, "team": team})
         return {"status": "success", "message": f"Successfully ingested {file.filename}", "details": result}
@@ -206,7 +283,7 @@ async def ingest_file(
         return classify_and_respond_to_error(e, context="file ingestion")
 
 
-@app.post("/query/")
+@app.post("/query/", response_class=ORJSONResponse)
 async def query_team(
     query: str = Form(...), 
     team: str = Form(...), 
@@ -214,6 +291,8 @@ async def query_team(
     user: UserContext = Depends(get_user_context_dependency)
 ):
     """Query a specific team index and return answer + provenance."""
+    if is_reserved_team(team):
+        return reserved_team_response(team)
     try:
         # Generate a temporary session ID if not provided (stateless fallback)
         if not session_id:
@@ -221,20 +300,10 @@ async def query_team(
             
         result = await query_service.query(query, team, session_id)
 
-        # Convert any numpy types to native Python equivalents (just in case)
-        def convert(obj):
-            if isinstance(obj, np.generic):
-                return obj.item()
-            elif isinstance(obj, dict):
-                return {k: convert(v) for k, v in obj.items()}
-            elif isinstance(obj, list):
-                return [convert(i) for i in obj]
-            return obj
-
-        clean_result = convert(result)
         # Log the query
         log_request(user, "QUERY", "document", {"team": team, "query": query[:100]})
-        return clean_result
+        # Returned as a Response so FastAPI skips jsonable_encoder; orjson handles numpy types
+        return ORJSONResponse(content=result)
 
     except Exception as e:
         logger.error(f"Query error: {e}")
@@ -248,6 +317,8 @@ async def query_team_stream(
     user: UserContext = Depends(get_user_context_dependency)
 ):
     """Query a team index and stream the answer token by token."""
+    if is_reserved_team(team):
+        return reserved_team_response(team)
     try:
         if not session_id:
             session_id = "temp_session"
@@ -283,19 +354,8 @@ def list_teams():
     Returns a list of team names that have been created via document ingestion.
     """
     try:
-        from qdrant_client import QdrantClient
-        from src.core.config import get_settings
-        
-        settings = get_settings()
-        client = QdrantClient(
-            host=settings.QDRANT_HOST,
-            port=settings.QDRANT_PORT,
-            url=settings.QDRANT_URL,
-            api_key=settings.QDRANT_API_KEY
-        )
-        
-        collections = client.get_collections().collections
-        teams = [col.name for col in collections]
+        collections = qdrant_client.get_collections().collections
+        teams = [col.name for col in collections if not is_reserved_team(col.name)]
         
         return {
             "status": "success",
@@ -307,27 +367,49 @@ def list_teams():
         return classify_and_respond_to_error(e, context="listing teams")
 
 
+def _scroll_document_counts(team: str) -> dict:
+    """Count chunks per filename by scrolling every point in the collection."""
+    documents = {}
+    offset = None
+    
+    while True:
+        results, next_offset = qdrant_client.scroll(
+            collection_name=team,
+            limit=100,
+            offset=offset,
+            with_payload=True,
+            with_vectors=False
+        )
+        
+        for point in results:
+            filename = point.payload.get("file_name", "Unknown")
+            if filename in documents:
+                documents[filename]["chunks"] += 1
+            else:
+                documents[filename] = {
+                    "filename": filename,
+                    "chunks": 1,
+                    "team": point.payload.get("team", team)
+                }
+        
+        if next_offset is None:
+            break
+        offset = next_offset
+    
+    return documents
+
+
 @app.get("/teams/{team}/documents")
 def list_team_documents(team: str):
     """
     List all documents that have been ingested into a specific team's knowledge base.
     Returns unique filenames and document counts.
     """
+    if is_reserved_team(team):
+        return reserved_team_response(team)
     try:
-        from qdrant_client import QdrantClient
-        from src.core.config import get_settings
-        
-        settings = get_settings()
-        client = QdrantClient(
-            host=settings.QDRANT_HOST,
-            port=settings.QDRANT_PORT,
-            url=settings.QDRANT_URL,
-            api_key=settings.QDRANT_API_KEY
-        )
-        
         # Check if collection exists
-        collections = [col.name for col in client.get_collections().collections]
-        if team not in collections:
+        if team not in get_collection_names():
             return create_error_response(
                 status_code=404,
                 error_type="TEAM_NOT_FOUND",
@@ -336,37 +418,25 @@ def list_team_documents(team: str):
             )
         
         # Get collection info
-        collection_info = client.get_collection(collection_name=team)
+        collection_info = qdrant_client.get_collection(collection_name=team)
         total_points = collection_info.points_count
         
-        # Scroll through all points to get unique filenames
-        # Note: For very large collections, this should be paginated
-        documents = {}
-        offset = None
-        
-        while True:
-            results, next_offset = client.scroll(
+        # Count chunks per file server-side via the file_name payload index.
+        # Collections created before the index existed fall back to a full scroll.
+        try:
+            facet = qdrant_client.facet(
                 collection_name=team,
-                limit=100,
-                offset=offset,
-                with_payload=True,
-                with_vectors=False
+                key="file_name",
+                limit=10_000,
+                exact=True
             )
-            
-            for point in results:
-                filename = point.payload.get("file_name", "Unknown")
-                if filename in documents:
-                    documents[filename]["chunks"] += 1
-                else:
-                    documents[filename] = {
-                        "filename": filename,
-                        "chunks": 1,
-                        "team": point.payload.get("team", team)
-                    }
-            
-            if next_offset is None:
-                break
-            offset = next_offset
+            documents = {
+                hit.value: {"filename": hit.value, "chunks": hit.count, "team": team}
+                for hit in facet.hits
+            }
+        except Exception as e:
+            logger.info(f"Facet unavailable for team '{team}', scrolling instead: {e}")
+            documents = _scroll_document_counts(team)
         
         return {
             "status": "success",
@@ -385,22 +455,11 @@ def delete_document(team: str, filename: str):
     """
     Delete a specific document (all its chunks) from a team's knowledge base.
     """
+    if is_reserved_team(team):
+        return reserved_team_response(team)
     try:
-        from qdrant_client import QdrantClient
-        from qdrant_client.models import Filter, FieldCondition, MatchValue
-        from src.core.config import get_settings
-        
-        settings = get_settings()
-        client = QdrantClient(
-            host=settings.QDRANT_HOST,
-            port=settings.QDRANT_PORT,
-            url=settings.QDRANT_URL,
-            api_key=settings.QDRANT_API_KEY
-        )
-        
         # Check if collection exists
-        collections = [col.name for col in client.get_collections().collections]
-        if team not in collections:
+        if team not in get_collection_names():
             return create_error_response(
                 status_code=404,
                 error_type="TEAM_NOT_FOUND",
@@ -408,8 +467,9 @@ def delete_document(team: str, filename: str):
                 suggestion="Please check the team name and try again."
             )
         
-        # Delete points matching the filename
-        result = client.delete(
+        # Delete points matching the filename; wait so no query can still retrieve
+        # (and re-cache) the document once its cached answers are invalidated
+        qdrant_client.delete(
             collection_name=team,
             points_selector=Filter(
                 must=[
@@ -418,8 +478,11 @@ def delete_document(team: str, filename: str):
                         match=MatchValue(value=filename)
                     )
                 ]
-            )
+            ),
+            wait=True
         )
+        # Sync endpoint (threadpool): run the async invalidation on the event loop
+        anyio.from_thread.run(query_service.invalidate_answer_cache, team)
         
         logger.info(f"Deleted document '{filename}' from team '{team}'")
         return {
@@ -439,21 +502,11 @@ def delete_team(team: str):
     Delete an entire team's knowledge base (Qdrant collection).
     WARNING: This permanently deletes all documents in the team.
     """
+    if is_reserved_team(team):
+        return reserved_team_response(team)
     try:
-        from qdrant_client import QdrantClient
-        from src.core.config import get_settings
-        
-        settings = get_settings()
-        client = QdrantClient(
-            host=settings.QDRANT_HOST,
-            port=settings.QDRANT_PORT,
-            url=settings.QDRANT_URL,
-            api_key=settings.QDRANT_API_KEY
-        )
-        
         # Check if collection exists
-        collections = [col.name for col in client.get_collections().collections]
-        if team not in collections:
+        if team not in get_collection_names():
             return create_error_response(
                 status_code=404,
                 error_type="TEAM_NOT_FOUND",
@@ -462,7 +515,9 @@ def delete_team(team: str):
             )
         
         # Delete the collection
-        client.delete_collection(collection_name=team)
+        qdrant_client.delete_collection(collection_name=team)
+        invalidate_collection_names()
+        anyio.from_thread.run(query_service.invalidate_answer_cache, team)
         
         logger.info(f"Deleted team/collection '{team}'")
         return {
@@ -1,6 +1,5 @@
 import os
 from pydantic_settings import BaseSettings
-from functools import lru_cache
 from dotenv import load_dotenv
 
 # Load .env file before settings are initialized
@@ -12,11 +11,16 @@ class Settings(BaseSettings):
     
     # PostgreSQL (Neon) - Parent Document Storage
     DATABASE_URL: str = os.getenv("DATABASE_URL", "")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 20))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 40))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", 1800))  # seconds; recycle before Neon drops idle connections
+    DB_COMMAND_TIMEOUT: int = int(os.getenv("DB_COMMAND_TIMEOUT", 60))  # seconds
     
     # Redis Configuration
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379")
     REDIS_SESSION_TTL: int = int(os.getenv("REDIS_SESSION_TTL", 86400))  # 24 hours
     REDIS_CACHE_TTL: int = int(os.getenv("REDIS_CACHE_TTL", 604800))  # 7 days
+    ANSWER_CACHE_TTL: int = int(os.getenv("ANSWER_CACHE_TTL", 3600))  # 1 hour
     
     # Qdrant Configuration
     QDRANT_HOST: str = os.getenv("QDRANT_HOST", "localhost")
@@ -32,6 +36,12 @@ class Settings(BaseSettings):
     CONTEXT_WINDOW: int = int(os.getenv("CONTEXT_WINDOW", 4096))  # 4096 for 4GB VRAM, 8192 for 8GB+
     MAX_NEW_TOKENS: int = int(os.getenv("MAX_NEW_TOKENS", 2048))
     N_GPU_LAYERS: int = int(os.getenv("N_GPU_LAYERS", -1)) # -1 for all layers
+    LLM_N_BATCH: int = int(os.getenv("LLM_N_BATCH", 512))  # prompt tokens per decode call
+    LLM_N_UBATCH: int = int(os.getenv("LLM_N_UBATCH", 512))  # physical micro-batch
+    LLM_FLASH_ATTN: bool = os.getenv("LLM_FLASH_ATTN", "true").lower() == "true"
+    LLM_OFFLOAD_KQV: bool = os.getenv("LLM_OFFLOAD_KQV", "true").lower() == "true"
+    LLM_KV_CACHE_TYPE: str = os.getenv("LLM_KV_CACHE_TYPE", "q8_0").strip().lower()  # "f16" or "q8_0" (q8_0 needs flash attention)
+    LLM_PROMPT_CACHE_MB: int = int(os.getenv("LLM_PROMPT_CACHE_MB", 0))  # RAM for saved KV prefixes; 0 disables
     
     class Config:
         case_sensitive = True
@@ -64,6 +74,8 @@ Your goal is to chat naturally with the user, answer general questions, and be p
 4.  **Format:** Use Markdown for clear formatting.
 """
 
-@lru_cache()
-def get_settings():
-    return Settings()
+# Built once at import; get_settings() just hands back this instance
+SETTINGS: Settings = Settings()
+
+def get_settings() -> Settings:
+    return SETTINGS
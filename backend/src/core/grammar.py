@@ -7,12 +7,15 @@ mandatory citations. This is enforced at the TOKEN level, making it
 mathematically impossible to generate uncited claims.
 
 Usage with llama-cpp-python:
-    from llama_cpp import LlamaGrammar
-    grammar = LlamaGrammar.from_string(CITATION_GRAMMAR)
+    grammar = get_compiled_llama_grammar(strict=False)
     response = llm(prompt, grammar=grammar)
 =============================================================================
 """
 
+from functools import lru_cache
+
+from llama_cpp import LlamaGrammar
+
 # =============================================================================
 # CITATION-ENFORCED GRAMMAR (GBNF Format)
 # =============================================================================
@@ -104,5 +107,22 @@ def get_citation_grammar(strict: bool = False) -> str:
     return FLEXIBLE_CITATION_GRAMMAR
 
 
+@lru_cache(maxsize=4)
+def get_compiled_llama_grammar(strict: bool = False) -> LlamaGrammar:
+    """
+    Get the parsed LlamaGrammar, built once per process.
+    
+    The lru_cache also keeps a module-level reference alive, so the underlying
+    llama.cpp grammar is not freed while a model may still be using it.
+    
+    Args:
+        strict: Same meaning as in get_citation_grammar()
+    
+    Returns:
+        LlamaGrammar ready to pass as the `grammar` argument
+    """
+    return LlamaGrammar.from_string(get_citation_grammar(strict))
+
+
 # For convenience - the default grammar to use
 DEFAULT_GRAMMAR = FLEXIBLE_CITATION_GRAMMAR
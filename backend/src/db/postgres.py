@@ -6,12 +6,13 @@ Uses SQLAlchemy async with asyncpg driver for Neon PostgreSQL.
 """
 
 import os
-import json
 import logging
 from typing import Optional, Dict, Any, List
 from contextlib import asynccontextmanager
 
-from sqlalchemy import String, Text, DateTime, func
+import orjson
+from sqlalchemy import Column, String, Text, DateTime, Index, func, text, literal_column, select, delete, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from langchain_core.documents import Document
@@ -20,6 +21,11 @@ from src.core.config import get_settings
 
 logger = logging.getLogger(__name__)
 
+# Metadata lookups used by delete_by_filename. The JSON key is inlined rather than
+# bound as a parameter, otherwise the planner cannot match the expression indexes.
+FILE_NAME_EXPR = "((metadata_json::jsonb) ->> 'file_name')"
+SOURCE_EXPR = "((metadata_json::jsonb) ->> 'source')"
+
 
 # =============================================================================
 # DATABASE MODELS
@@ -38,6 +44,12 @@ class ParentDocumentModel(Base):
     metadata_json: Mapped[str] = mapped_column(Text, nullable=False)  # JSON serialized
     team: Mapped[str] = mapped_column(String(255), nullable=False, index=True)
     created_at: Mapped[DateTime] = mapped_column(DateTime, server_default=func.now())
+    
+    # Expression indexes backing delete_by_filename (matches on either metadata key)
+    __table_args__ = (
+        Index("ix_parent_team_filename", "team", text(FILE_NAME_EXPR)),
+        Index("ix_parent_team_source", "team", text(SOURCE_EXPR)),
+    )
 
 
 # =============================================================================
@@ -75,9 +87,14 @@ class PostgresConnection:
         
         self._engine = create_async_engine(
             database_url,
-            pool_size=5,
-            max_overflow=10,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
             pool_pre_ping=True,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            connect_args={
+                "server_settings": {"application_name": "nexus-rag"},
+                "command_timeout": settings.DB_COMMAND_TIMEOUT
+            },
             echo=False
         )
         
@@ -87,12 +104,49 @@ class PostgresConnection:
             expire_on_commit=False
         )
         
-        # Create tables
+        # Create tables (a new table gets its indexes here, while it is still empty)
         async with self._engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
         
+        # create_all skips indexes on tables that already exist
+        await self._create_missing_indexes()
+        
         logger.info("✅ PostgreSQL connection established and tables created!")
     
+    async def _create_missing_indexes(self):
+        """
+        Build indexes missing from an existing table without blocking writers.
+        
+        CREATE INDEX CONCURRENTLY cannot run inside a transaction, so this uses an
+        autocommit connection. An interrupted concurrent build leaves an INVALID
+        index behind, which is dropped and rebuilt.
+        """
+        table = ParentDocumentModel.__table__
+        autocommit_engine = self._engine.execution_options(isolation_level="AUTOCOMMIT")
+        
+        async with autocommit_engine.connect() as conn:
+            for index in table.indexes:
+                valid = await conn.scalar(
+                    text(
+                        "SELECT i.indisvalid FROM pg_index i "
+                        "JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"
+                    ),
+                    {"name": index.name}
+                )
+                if valid:
+                    continue
+                if valid is False:
+                    logger.warning(f"⚠️ Rebuilding invalid index {index.name}")
+                    await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}"))
+                
+                columns = ", ".join(
+                    expr.name if isinstance(expr, Column) else str(expr) for expr in index.expressions
+                )
+                logger.info(f"🔨 Building index {index.name} concurrently...")
+                await conn.execute(text(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index.name} ON {table.name} ({columns})"
+                ))
+    
     @asynccontextmanager
     async def session(self):
         """Get an async database session."""
@@ -118,6 +172,9 @@ class ParentDocumentStore:
     Replaces langchain's InMemoryStore for production use.
     """
     
+    # Rows per multi-row INSERT in store_batch
+    BATCH_SIZE = 1000
+    
     def __init__(self):
         self.db = PostgresConnection()
         self._initialized = False
@@ -139,27 +196,24 @@ class ParentDocumentStore:
         """
         await self._ensure_initialized()
         
+        metadata_json = orjson.dumps(document.metadata).decode()
+        
         async with self.db.session() as session:
-            # Check if exists, update if so
-            from sqlalchemy import select
-            stmt = select(ParentDocumentModel).where(ParentDocumentModel.id == parent_id)
-            result = await session.execute(stmt)
-            existing = result.scalar_one_or_none()
-            
-            metadata_json = json.dumps(document.metadata)
-            
-            if existing:
-                existing.content = document.page_content
-                existing.metadata_json = metadata_json
-                existing.team = team
-            else:
-                new_doc = ParentDocumentModel(
-                    id=parent_id,
-                    content=document.page_content,
-                    metadata_json=metadata_json,
-                    team=team
-                )
-                session.add(new_doc)
+            # Insert, or update in place if the id already exists
+            stmt = pg_insert(ParentDocumentModel).values(
+                id=parent_id,
+                content=document.page_content,
+                metadata_json=metadata_json,
+                team=team
+            ).on_conflict_do_update(
+                index_elements=["id"],
+                set_={
+                    "content": document.page_content,
+                    "metadata_json": metadata_json,
+                    "team": team
+                }
+            )
+            await session.execute(stmt)
         
         logger.debug(f"📝 Stored parent document: {parent_id}")
     
@@ -173,16 +227,29 @@ class ParentDocumentStore:
         """
         await self._ensure_initialized()
         
+        rows = [
+            {
+                "id": parent_id,
+                "content": document.page_content,
+                "metadata_json": orjson.dumps(document.metadata).decode(),
+                "team": team
+            }
+            for parent_id, document in documents
+        ]
+        
         async with self.db.session() as session:
-            for parent_id, document in documents:
-                metadata_json = json.dumps(document.metadata)
-                new_doc = ParentDocumentModel(
-                    id=parent_id,
-                    content=document.page_content,
-                    metadata_json=metadata_json,
-                    team=team
+            # One multi-row upsert per slice keeps us under Postgres' bind parameter limit
+            for i in range(0, len(rows), self.BATCH_SIZE):
+                stmt = pg_insert(ParentDocumentModel).values(rows[i:i + self.BATCH_SIZE])
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["id"],
+                    set_={
+                        "content": stmt.excluded.content,
+                        "metadata_json": stmt.excluded.metadata_json,
+                        "team": stmt.excluded.team
+                    }
                 )
-                session.add(new_doc)
+                await session.execute(stmt)
         
         logger.info(f"📝 Stored {len(documents)} parent documents to PostgreSQL")
     
@@ -199,17 +266,40 @@ class ParentDocumentStore:
         await self._ensure_initialized()
         
         async with self.db.session() as session:
-            from sqlalchemy import select
             stmt = select(ParentDocumentModel).where(ParentDocumentModel.id == parent_id)
             result = await session.execute(stmt)
             row = result.scalar_one_or_none()
             
             if row:
-                metadata = json.loads(row.metadata_json)
+                metadata = orjson.loads(row.metadata_json)
                 return Document(page_content=row.content, metadata=metadata)
             
             return None
     
+    async def get_batch(self, parent_ids: List[str]) -> Dict[str, Document]:
+        """
+        Retrieve several parent documents in one query.
+        
+        Args:
+            parent_ids: The unique identifiers
+            
+        Returns:
+            Dict mapping parent_id to Document (ids that were not found are omitted)
+        """
+        if not parent_ids:
+            return {}
+        
+        await self._ensure_initialized()
+        
+        async with self.db.session() as session:
+            stmt = select(ParentDocumentModel).where(ParentDocumentModel.id.in_(parent_ids))
+            result = await session.execute(stmt)
+            
+            return {
+                row.id: Document(page_content=row.content, metadata=orjson.loads(row.metadata_json))
+                for row in result.scalars()
+            }
+    
     async def delete_by_team(self, team: str) -> int:
         """
         Delete all parent documents for a team.
@@ -223,7 +313,6 @@ class ParentDocumentStore:
         await self._ensure_initialized()
         
         async with self.db.session() as session:
-            from sqlalchemy import delete
             stmt = delete(ParentDocumentModel).where(ParentDocumentModel.team == team)
             result = await session.execute(stmt)
             deleted_count = result.rowcount
@@ -245,25 +334,19 @@ class ParentDocumentStore:
         await self._ensure_initialized()
         
         async with self.db.session() as session:
-            from sqlalchemy import select, delete
-            
-            # Get all documents for this team and filter by filename in metadata
-            stmt = select(ParentDocumentModel).where(ParentDocumentModel.team == team)
+            # Match the filename inside the JSON metadata server-side (index-backed)
+            stmt = delete(ParentDocumentModel).where(
+                ParentDocumentModel.team == team,
+                or_(
+                    literal_column(FILE_NAME_EXPR) == filename,
+                    literal_column(SOURCE_EXPR) == filename
+                )
+            ).returning(ParentDocumentModel.id)
             result = await session.execute(stmt)
-            docs = result.scalars().all()
-            
-            deleted_ids = []
-            for doc in docs:
-                metadata = json.loads(doc.metadata_json)
-                if metadata.get("file_name") == filename or metadata.get("source") == filename:
-                    deleted_ids.append(doc.id)
-            
-            if deleted_ids:
-                stmt = delete(ParentDocumentModel).where(ParentDocumentModel.id.in_(deleted_ids))
-                await session.execute(stmt)
+            deleted_count = len(result.scalars().all())
         
-        logger.info(f"🗑️ Deleted {len(deleted_ids)} parent documents for file: {filename}")
-        return len(deleted_ids)
+        logger.info(f"🗑️ Deleted {deleted_count} parent documents for file: {filename}")
+        return deleted_count
 
 
 # =============================================================================
@@ -4,13 +4,14 @@ Redis Cache Module for NEXUS Backend
 Provides:
 - Parent document caching (write-through cache)
 - Session memory storage (replaces in-memory SessionMemoryStore)
+- Semantic answer cache payloads (answers for previously seen questions)
 - TTL-based expiration for automatic cleanup
 """
 
-import json
 import logging
 from typing import Optional, Dict, List, Any
 
+import orjson
 import redis.asyncio as redis
 from langchain_core.documents import Document
 
@@ -76,6 +77,7 @@ class ParentDocumentCache:
     """
     
     PREFIX = "parent_doc:"
+    TEAM_PREFIX = "parent_doc_team:"  # SET of cached parent ids per team
     
     def __init__(self):
         self.redis_conn = RedisConnection()
@@ -96,7 +98,7 @@ class ParentDocumentCache:
         
         data = await client.get(key)
         if data:
-            parsed = json.loads(data)
+            parsed = orjson.loads(data)
             return Document(
                 page_content=parsed["content"],
                 metadata=parsed["metadata"]
@@ -104,23 +106,63 @@ class ParentDocumentCache:
         
         return None
     
-    async def set(self, parent_id: str, document: Document):
+    async def mget(self, parent_ids: List[str]) -> List[Optional[Document]]:
         """
-        Cache a parent document.
+        Get several parent documents from cache in a single MGET.
         
         Args:
-            parent_id: Unique identifier
-            document: LangChain Document object
+            parent_ids: Unique identifiers
+            
+        Returns:
+            List aligned with parent_ids; None where a document is not cached
         """
+        if not parent_ids:
+            return []
+        
         client = await self.redis_conn.get_client()
-        key = f"{self.PREFIX}{parent_id}"
+        keys = [f"{self.PREFIX}{parent_id}" for parent_id in parent_ids]
+        
+        documents = []
+        for data in await client.mget(keys):
+            if data:
+                parsed = orjson.loads(data)
+                documents.append(Document(
+                    page_content=parsed["content"],
+                    metadata=parsed["metadata"]
+                ))
+            else:
+                documents.append(None)
         
-        data = json.dumps({
+        return documents
+    
+    def _queue_set(self, pipe, parent_id: str, document: Document):
+        """Queue the SETEX for a document plus its team-index SADD on a pipeline."""
+        key = f"{self.PREFIX}{parent_id}"
+        data = orjson.dumps({
             "content": document.page_content,
             "metadata": document.metadata
         })
+        pipe.setex(key, self.settings.REDIS_CACHE_TTL, data)
+        
+        team = document.metadata.get("team")
+        if team:
+            team_key = f"{self.TEAM_PREFIX}{team}"
+            pipe.sadd(team_key, parent_id)
+            pipe.expire(team_key, self.settings.REDIS_CACHE_TTL)
+    
+    async def set(self, parent_id: str, document: Document):
+        """
+        Cache a parent document.
+        
+        Args:
+            parent_id: Unique identifier
+            document: LangChain Document object
+        """
+        client = await self.redis_conn.get_client()
         
-        await client.setex(key, self.settings.REDIS_CACHE_TTL, data)
+        pipe = client.pipeline()
+        self._queue_set(pipe, parent_id, document)
+        await pipe.execute()
     
     async def set_batch(self, documents: List[tuple]):
         """
@@ -133,12 +175,7 @@ class ParentDocumentCache:
         
         pipe = client.pipeline()
         for parent_id, document in documents:
-            key = f"{self.PREFIX}{parent_id}"
-            data = json.dumps({
-                "content": document.page_content,
-                "metadata": document.metadata
-            })
-            pipe.setex(key, self.settings.REDIS_CACHE_TTL, data)
+            self._queue_set(pipe, parent_id, document)
         
         await pipe.execute()
         logger.info(f"📦 Cached {len(documents)} parent documents in Redis")
@@ -149,17 +186,14 @@ class ParentDocumentCache:
         key = f"{self.PREFIX}{parent_id}"
         await client.delete(key)
     
-    async def delete_pattern(self, pattern: str):
-        """Delete all keys matching a pattern."""
+    async def delete_team(self, team: str):
+        """Delete all cached parent documents for a team using its id index."""
         client = await self.redis_conn.get_client()
+        team_key = f"{self.TEAM_PREFIX}{team}"
         
-        cursor = 0
-        while True:
-            cursor, keys = await client.scan(cursor, match=f"{self.PREFIX}{pattern}")
-            if keys:
-                await client.delete(*keys)
-            if cursor == 0:
-                break
+        parent_ids = await client.smembers(team_key)
+        keys = [f"{self.PREFIX}{parent_id}" for parent_id in parent_ids]
+        await client.delete(*keys, team_key)
 
 
 # =============================================================================
@@ -172,7 +206,12 @@ class RedisSessionStore:
     Replaces the in-memory SessionMemoryStore.
     """
     
-    PREFIX = "session:"
+    # History is a Redis LIST (one JSON message per element); the prefix differs
+    # from the old JSON-blob keys so the two formats never collide (WRONGTYPE)
+    PREFIX = "session_history:"
+    # Old format: the whole history as one JSON array, migrated on first access
+    LEGACY_PREFIX = "session:"
+    MAX_MESSAGES = 20
     
     def __init__(self):
         self.redis_conn = RedisConnection()
@@ -183,34 +222,64 @@ class RedisSessionStore:
         client = await self.redis_conn.get_client()
         key = f"{self.PREFIX}{session_id}"
         
-        data = await client.get(key)
-        if data:
-            return json.loads(data)
-        return []
+        messages = await client.lrange(key, 0, -1)
+        if not messages and await self._migrate_legacy_history(client, session_id):
+            messages = await client.lrange(key, 0, -1)
+        return [orjson.loads(msg) for msg in messages]
     
     async def add_message(self, session_id: str, role: str, content: str):
         """Add a message to session history."""
         client = await self.redis_conn.get_client()
         key = f"{self.PREFIX}{session_id}"
         
-        # Get existing history
-        history = await self.get_history(session_id)
+        # Append, keep only the last MAX_MESSAGES and refresh the TTL in one round trip
+        pipe = client.pipeline()
+        pipe.rpush(key, orjson.dumps({"role": role, "content": content}))
+        pipe.ltrim(key, -self.MAX_MESSAGES, -1)
+        pipe.expire(key, self.settings.REDIS_SESSION_TTL)
+        length, _, _ = await pipe.execute()
         
-        # Add new message
-        history.append({"role": role, "content": content})
+        # A freshly created list may have an old-format history to put in front of it
+        if length == 1:
+            await self._migrate_legacy_history(client, session_id)
+    
+    async def _migrate_legacy_history(self, client, session_id: str) -> bool:
+        """
+        Move a history stored in the old JSON-array format into the list key.
         
-        # Keep only last 20 messages
-        if len(history) > 20:
-            history = history[-20:]
+        Only called when the list is empty or was just created, so migrated and
+        new sessions pay nothing. Old messages go in front of any new ones.
         
-        # Save with TTL
-        await client.setex(key, self.settings.REDIS_SESSION_TTL, json.dumps(history))
+        Returns:
+            True if an old-format history was found
+        """
+        legacy_key = f"{self.LEGACY_PREFIX}{session_id}"
+        
+        # GET + DEL in one transaction: concurrent callers can't both migrate it
+        pipe = client.pipeline(transaction=True)
+        pipe.get(legacy_key)
+        pipe.delete(legacy_key)
+        data, _ = await pipe.execute()
+        if not data:
+            return False
+        
+        messages = orjson.loads(data)[-self.MAX_MESSAGES:]
+        if messages:
+            key = f"{self.PREFIX}{session_id}"
+            pipe = client.pipeline()
+            # LPUSH prepends one value at a time, so push newest first to keep order
+            pipe.lpush(key, *[orjson.dumps(msg) for msg in reversed(messages)])
+            pipe.ltrim(key, -self.MAX_MESSAGES, -1)
+            pipe.expire(key, self.settings.REDIS_SESSION_TTL)
+            await pipe.execute()
+        
+        logger.info(f"🔄 Migrated {len(messages)} messages of session {session_id} to list format")
+        return True
     
     async def clear_session(self, session_id: str):
         """Clear a session's history."""
         client = await self.redis_conn.get_client()
-        key = f"{self.PREFIX}{session_id}"
-        await client.delete(key)
+        await client.delete(f"{self.PREFIX}{session_id}", f"{self.LEGACY_PREFIX}{session_id}")
     
     async def format_history(self, session_id: str) -> str:
         """Format history as string for prompts."""
@@ -251,12 +320,63 @@ class RedisSessionStore:
             return "No previous conversation."
 
 
+# =============================================================================
+# ANSWER CACHE (REDIS)
+# =============================================================================
+
+class AnswerCache:
+    """
+    Stores full RAG results (answer + provenance) for the semantic answer cache.
+    Entries are looked up by the id of the matching question vector in Qdrant.
+    
+    Each team has a generation counter, bumped whenever its documents change.
+    Entries are tagged with the generation they were computed under, and only
+    entries from the current generation are served.
+    """
+    
+    PREFIX = "answer_cache:"
+    GENERATION_PREFIX = "answer_cache_gen:"
+    
+    def __init__(self):
+        self.redis_conn = RedisConnection()
+        self.settings = get_settings()
+    
+    async def get(self, entry_id: str) -> Optional[Dict[str, Any]]:
+        """Get a cached result, or None if it is missing or has expired."""
+        client = await self.redis_conn.get_client()
+        data = await client.get(f"{self.PREFIX}{entry_id}")
+        if data:
+            return orjson.loads(data)
+        return None
+    
+    async def set(self, entry_id: str, result: Dict[str, Any]):
+        """Cache a result for ANSWER_CACHE_TTL seconds."""
+        client = await self.redis_conn.get_client()
+        await client.setex(
+            f"{self.PREFIX}{entry_id}",
+            self.settings.ANSWER_CACHE_TTL,
+            orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY)
+        )
+    
+    async def get_generation(self, team: str) -> int:
+        """Get the team's current cache generation (0 if never invalidated)."""
+        client = await self.redis_conn.get_client()
+        value = await client.get(f"{self.GENERATION_PREFIX}{team}")
+        return int(value) if value else 0
+    
+    async def bump_generation(self, team: str) -> int:
+        """Start a new cache generation for a team, retiring every existing entry."""
+        client = await self.redis_conn.get_client()
+        return await client.incr(f"{self.GENERATION_PREFIX}{team}")
+
+
 # =============================================================================
 # SINGLETON ACCESSORS
 # =============================================================================
 
 _parent_cache: Optional[ParentDocumentCache] = None
 _session_store: Optional[RedisSessionStore] = None
+_answer_cache: Optional[AnswerCache] = None
 
 
 def get_parent_cache() -> ParentDocumentCache:
@@ -273,3 +393,11 @@ def get_session_store() -> RedisSessionStore:
     if _session_store is None:
         _session_store = RedisSessionStore()
     return _session_store
+
+
+def get_answer_cache() -> AnswerCache:
+    """Get or create singleton answer cache."""
+    global _answer_cache
+    if _answer_cache is None:
+        _answer_cache = AnswerCache()
+    return _answer_cache
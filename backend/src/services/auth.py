@@ -7,10 +7,11 @@ Handles:
 - Request logging for audit trail
 """
 
-from fastapi import Request, HTTPException, Header
+from fastapi import Request, HTTPException
 from fastapi.responses import JSONResponse
 from typing import Optional
 from dataclasses import dataclass
+import hmac
 import logging
 import os
 
@@ -36,10 +37,11 @@ def verify_internal_secret(x_internal_secret: Optional[str]) -> bool:
     if not x_internal_secret:
         return False
     
-    return x_internal_secret == API_SECRET
+    # Constant-time comparison so response timing leaks nothing about the secret
+    return hmac.compare_digest(x_internal_secret.encode("utf-8"), API_SECRET.encode("utf-8"))
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class UserContext:
     """User context extracted from request headers or API key."""
     user_id: Optional[str] = None
@@ -49,6 +51,10 @@ class UserContext:
     is_authenticated: bool = False
 
 
+# Shared context for anonymous / unverified requests (safe to alias: frozen)
+_ANON_CTX = UserContext()
+
+
 def extract_user_context(
     x_user_id: Optional[str] = None,
     x_user_email: Optional[str] = None,
@@ -66,61 +72,71 @@ def extract_user_context(
     - X-Team-Id: Current team context for vector filtering
     - X-API-Key: API key for programmatic access
     """
-    ctx = UserContext()
-    
     if x_api_key:
         # API key takes precedence - no secret check needed
         # (API keys are self-authenticating)
-        ctx.api_key = x_api_key
-        ctx.is_authenticated = True
         # Note: In production, lookup API key in DB to get user_id and team_id
         logger.info(f"[AUTH] API key authentication: {x_api_key[:8]}...")
-    elif x_user_id:
+        return UserContext(api_key=x_api_key, is_authenticated=True)
+    
+    if x_user_id:
         # Session-based auth from frontend - MUST verify internal secret
         if not verify_internal_secret(x_internal_secret):
             logger.warning(f"[AUTH] Invalid or missing X-Internal-Secret for user {x_user_email}")
             # Return unauthenticated context instead of raising
             # (individual endpoints can decide if auth is required)
-            return ctx
+            return _ANON_CTX
         
-        ctx.user_id = x_user_id
-        ctx.email = x_user_email
-        ctx.team_id = x_team_id
-        ctx.is_authenticated = True
         logger.info(f"[AUTH] Session authentication: user={x_user_email}, team={x_team_id}")
-    else:
-        # Anonymous request
-        logger.debug("[AUTH] Anonymous request (no auth headers)")
+        return UserContext(
+            user_id=x_user_id,
+            email=x_user_email,
+            team_id=x_team_id,
+            is_authenticated=True
+        )
     
-    return ctx
+    # Anonymous request
+    logger.debug("[AUTH] Anonymous request (no auth headers)")
+    return _ANON_CTX
 
 
-def get_user_context_dependency(
-    x_user_id: Optional[str] = Header(None, alias="X-User-Id"),
-    x_user_email: Optional[str] = Header(None, alias="X-User-Email"),
-    x_team_id: Optional[str] = Header(None, alias="X-Team-Id"),
-    x_api_key: Optional[str] = Header(None, alias="X-API-Key"),
-    x_internal_secret: Optional[str] = Header(None, alias="X-Internal-Secret")
-) -> UserContext:
+# Raw ASGI header names (lowercase bytes) -> extract_user_context() kwarg
+_AUTH_HEADERS = {
+    b"x-user-id": "x_user_id",
+    b"x-user-email": "x_user_email",
+    b"x-team-id": "x_team_id",
+    b"x-api-key": "x_api_key",
+    b"x-internal-secret": "x_internal_secret",
+}
+
+
+def _user_context_from_request(request: Request) -> UserContext:
+    """
+    Build the user context with a single pass over the raw ASGI headers,
+    instead of resolving five separate Header() parameters per request.
+    """
+    headers = {}
+    for name, value in request.scope["headers"]:
+        key = _AUTH_HEADERS.get(name)
+        if key is not None and key not in headers:
+            headers[key] = value.decode("latin-1")
+    return extract_user_context(**headers)
+
+
+def get_user_context_dependency(request: Request) -> UserContext:
     """
     FastAPI dependency for extracting user context from request headers.
     Use in route handlers: user: UserContext = Depends(get_user_context_dependency)
     """
-    return extract_user_context(x_user_id, x_user_email, x_team_id, x_api_key, x_internal_secret)
+    return _user_context_from_request(request)
 
 
-def require_auth_dependency(
-    x_user_id: Optional[str] = Header(None, alias="X-User-Id"),
-    x_user_email: Optional[str] = Header(None, alias="X-User-Email"),
-    x_team_id: Optional[str] = Header(None, alias="X-Team-Id"),
-    x_api_key: Optional[str] = Header(None, alias="X-API-Key"),
-    x_internal_secret: Optional[str] = Header(None, alias="X-Internal-Secret")
-) -> UserContext:
+def require_auth_dependency(request: Request) -> UserContext:
     """
     FastAPI dependency that REQUIRES authentication.
     Raises 401 if no valid auth is provided.
     """
-    ctx = extract_user_context(x_user_id, x_user_email, x_team_id, x_api_key, x_internal_secret)
+    ctx = _user_context_from_request(request)
     
     if not ctx.is_authenticated:
         raise HTTPException(
@@ -145,14 +161,16 @@ def log_request(
     Log a request for audit purposes.
     In production, this would write to a database or audit service.
     """
+    api_key = user.api_key
     log_entry = {
         "action": action,
         "resource": resource,
         "user_id": user.user_id,
         "email": user.email,
         "team_id": user.team_id,
-        "api_key": user.api_key[:8] + "..." if user.api_key else None,
+        "api_key": api_key[:8] + "..." if api_key else None,
         "details": details
     }
-    logger.info(f"[AUDIT] {log_entry}")
+    # Lazy %-formatting: the dict is only rendered if INFO is actually emitted
+    logger.info("[AUDIT] %s", log_entry)
     return log_entry
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from llama_index.core.node_parser import (
     SentenceWindowNodeParser,
     SemanticSplitterNodeParser
@@ -5,13 +7,18 @@ from llama_index.core.node_parser import (
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 from llama_index.core import Settings
 
-# Ensure the global embedding model is set, though usually handled in main config
-# We might need it here for Semantic Splitting
-embed_model = HuggingFaceEmbedding(model_name="BAAI/bge-small-en-v1.5")
+
+# Only semantic splitting needs an embedding model, so load it on first use
+# instead of at import time
+@lru_cache(maxsize=1)
+def _get_embed_model() -> HuggingFaceEmbedding:
+    return HuggingFaceEmbedding(model_name="BAAI/bge-small-en-v1.5")
 
 
 class ChunkingService:
+    # Parsers are stateless, so one instance per parameter set is shared across ingests
     @staticmethod
+    @lru_cache(maxsize=8)
     def get_sentence_window_parser(window_size: int = 3):
         return SentenceWindowNodeParser.from_defaults(
             window_size=window_size,
@@ -20,11 +27,12 @@ class ChunkingService:
         )
 
     @staticmethod
+    @lru_cache(maxsize=8)
     def get_semantic_parser(buffer_size: int = 1, breakpoint_percentile_threshold: int = 95):
         return SemanticSplitterNodeParser(
             buffer_size=buffer_size,
             breakpoint_percentile_threshold=breakpoint_percentile_threshold,
-            embed_model=embed_model
+            embed_model=_get_embed_model()
         )
 
 def get_chunker(strategy: str = "window"):
@@ -15,11 +15,18 @@ Usage:
 
 import re
 import logging
-from typing import List, Dict, Any
+from functools import lru_cache
+from typing import List, Dict, Any, Iterator, Tuple
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=1024)
+def _basename(name: str) -> str:
+    """Strip any POSIX or Windows directory prefix from a filename."""
+    return name.rsplit("/", 1)[-1].rsplit("\\", 1)[-1]
+
+
 class CitationPostProcessor:
     """
     Post-processes LLM answers to ensure every sentence has a citation.
@@ -35,8 +42,8 @@ class CitationPostProcessor:
         pass
     
     def has_citation(self, text: str) -> bool:
-        """Check if text contains a citation."""
-        return bool(self.CITATION_PATTERN.search(text))
+        """Check if text contains a citation (plain substring test on the literal prefix)."""
+        return "[Source:" in text
     
     def get_primary_source(self, provenance: List[Dict[str, Any]]) -> str:
         """Get the most relevant source from provenance list."""
@@ -47,13 +54,19 @@ class CitationPostProcessor:
         first_doc = provenance[0]
         filename = first_doc.get("file_name", first_doc.get("source", "documents"))
         
-        # Clean up the filename
-        if "/" in filename:
-            filename = filename.split("/")[-1]
-        if "\\" in filename:
-            filename = filename.split("\\")[-1]
-            
-        return filename
+        return _basename(filename)
+    
+    def _iter_sentences(self, text: str) -> Iterator[Tuple[str, str]]:
+        """
+        Yield (sentence, following whitespace) pairs over the stripped text.
+        The original separators (e.g. paragraph breaks) are kept so the answer
+        can be reassembled with its formatting intact.
+        """
+        start = 0
+        for boundary in self.SENTENCE_PATTERN.finditer(text):
+            yield text[start:boundary.start()], boundary.group()
+            start = boundary.end()
+        yield text[start:], ""
     
     def ensure_citations(self, answer: str, provenance: List[Dict[str, Any]]) -> str:
         """
@@ -69,28 +82,32 @@ class CitationPostProcessor:
         if not answer or not answer.strip():
             return answer
         
+        stripped = answer.strip()
+        
+        # Fast path: well-behaved output already cites every sentence
+        if "[Source:" in stripped and all(self.has_citation(s) for s, _ in self._iter_sentences(stripped)):
+            return answer
+        
         primary_source = self.get_primary_source(provenance)
         citation = f"[Source: {primary_source}]"
         
-        # Split into sentences
-        sentences = self.SENTENCE_PATTERN.split(answer)
+        # Keep the answer's own whitespace (leading/trailing and between sentences)
+        # so both paths return identically formatted text
+        leading = answer[:len(answer) - len(answer.lstrip())]
+        trailing = answer[len(answer.rstrip()):]
         
-        enhanced_sentences = []
+        parts = [leading]
         citations_added = 0
         
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if not sentence:
-                continue
-                
+        for sentence, separator in self._iter_sentences(stripped):
             # Skip if it's just a citation
             if sentence.startswith("[Source:") and sentence.endswith("]"):
-                enhanced_sentences.append(sentence)
+                parts += (sentence, separator)
                 continue
             
             # Check if sentence already has a citation
             if self.has_citation(sentence):
-                enhanced_sentences.append(sentence)
+                parts += (sentence, separator)
             else:
                 # Add citation before the period (or at end if no period)
                 if sentence.endswith(('.', '!', '?')):
@@ -100,13 +117,14 @@ class CitationPostProcessor:
                 else:
                     enhanced_sentence = f"{sentence} {citation}"
                     
-                enhanced_sentences.append(enhanced_sentence)
+                parts += (enhanced_sentence, separator)
                 citations_added += 1
         
         if citations_added > 0:
             logger.info(f"📎 Added {citations_added} missing citation(s)")
         
-        return " ".join(enhanced_sentences)
+        parts.append(trailing)
+        return "".join(parts)
 
 
 # Singleton instance
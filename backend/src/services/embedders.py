@@ -0,0 +1,75 @@
+"""
+Shared Embedding Models
+=======================
+Ingestion and query use the same dense and sparse models. Loading them once per
+process instead of once per service halves start-up time and embedder RAM.
+
+Both run on CPU through FastEmbed (ONNX Runtime) to keep VRAM for the LLM.
+"""
+
+import logging
+from functools import lru_cache
+from typing import List
+
+from fastembed import TextEmbedding, SparseTextEmbedding
+from fastembed.common.model_description import ModelSource, PoolingType
+
+logger = logging.getLogger(__name__)
+
+# FastEmbed's built-in "BAAI/bge-small-en-v1.5" is an int8-quantized export, whose
+# vectors drift from the full-precision model existing collections were indexed
+# with. Dense models listed here load the original fp32 ONNX weights instead.
+FP32_DENSE_MODELS = {
+    "BAAI/bge-small-en-v1.5": {
+        "model": "BAAI/bge-small-en-v1.5-fp32",
+        "pooling": PoolingType.CLS,
+        "normalization": True,
+        "sources": ModelSource(hf="BAAI/bge-small-en-v1.5"),
+        "dim": 384,
+        "model_file": "onnx/model.onnx",
+    },
+}
+
+
+class DenseEmbedder:
+    """
+    LangChain-style wrapper (embed_query / embed_documents) around FastEmbed's
+    ONNX TextEmbedding, so the router and services keep the same interface.
+    """
+    
+    def __init__(self, model_name: str, batch_size: int = 64):
+        self.model = TextEmbedding(model_name=model_name)
+        self.batch_size = batch_size
+    
+    def embed_query(self, text: str) -> List[float]:
+        return next(iter(self.model.embed([text]))).tolist()
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # ONNX Runtime already uses every core per batch, so no data-parallel workers
+        return [emb.tolist() for emb in self.model.embed(texts, batch_size=self.batch_size)]
+
+
+@lru_cache(maxsize=None)
+def _resolve_dense_model(model_name: str) -> str:
+    """Register the fp32 variant of a dense model with FastEmbed (once) and return its name."""
+    spec = FP32_DENSE_MODELS.get(model_name)
+    if spec is None:
+        return model_name
+    
+    TextEmbedding.add_custom_model(**spec)
+    return spec["model"]
+
+
+@lru_cache(maxsize=None)
+def get_dense_embedder(model_name: str) -> DenseEmbedder:
+    """Get the process-wide dense embedder for a model."""
+    resolved = _resolve_dense_model(model_name)
+    logger.info(f"Loading Dense Embeddings: {resolved}")
+    return DenseEmbedder(resolved)
+
+
+@lru_cache(maxsize=None)
+def get_sparse_embedder(model_name: str) -> SparseTextEmbedding:
+    """Get the process-wide sparse embedder for a model."""
+    logger.info(f"Loading Sparse Embeddings: {model_name}")
+    return SparseTextEmbedding(model_name=model_name)
@@ -11,19 +11,34 @@ Security layer for protecting against:
 """
 
 import re
+import string
 import logging
+from functools import lru_cache
 from typing import Tuple, Optional, List
 from dataclasses import dataclass
 
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+def _compile_union(patterns: List[str], flags: int = 0) -> "re.Pattern[str]":
+    """
+    Compile a pattern list into one alternation so the input is scanned once.
+    Each alternative is wrapped in a named group p<index>, so `match.lastgroup`
+    tells which original pattern fired.
+    """
+    return re.compile(
+        "|".join(f"(?P<p{i}>{pattern})" for i, pattern in enumerate(patterns)),
+        flags
+    )
+
+
+@dataclass(slots=True)
 class GuardrailResult:
     """Result of guardrail check."""
     is_safe: bool
     reason: Optional[str] = None
     sanitized_input: Optional[str] = None
+    log_detail: Optional[str] = None  # Why it was blocked, for the audit log (not shown to users)
 
 
 class PromptGuardrails:
@@ -86,10 +101,24 @@ class PromptGuardrails:
         r"generate\s+(illegal|harmful|malicious)",
     ]
     
+    _INJECTION_RE = _compile_union(INJECTION_PATTERNS, re.IGNORECASE)
+    _HARMFUL_RE = _compile_union(HARMFUL_PATTERNS, re.IGNORECASE)
+    
+    # Deletes ASCII alphanumerics and allowed punctuation; whatever survives
+    # translate() is a candidate "special" character
+    _ALLOWED_TABLE = str.maketrans("", "", string.ascii_letters + string.digits + " .,?!-'\"")
+    
+    # Null bytes and control characters, except \t \n \r which whitespace
+    # normalization folds into spaces anyway
+    _CTRL_TABLE = dict.fromkeys([*range(0x00, 0x09), 0x0b, 0x0c, *range(0x0e, 0x20), 0x7f])
+    
     # ==========================================================================
     # INPUT GUARDRAILS
     # ==========================================================================
     
+    # Inputs up to this length have their verdicts memoized (retries, refreshes)
+    MAX_CACHED_INPUT_LENGTH = 1024
+    
     @classmethod
     def check_input(cls, user_input: str) -> GuardrailResult:
         """
@@ -98,44 +127,70 @@ class PromptGuardrails:
         Returns:
             GuardrailResult with safety status and reason if blocked.
         """
+        if user_input and len(user_input) <= cls.MAX_CACHED_INPUT_LENGTH:
+            return GuardrailResult(*cls._check_input_cached(user_input))
+        
+        return cls._check_input_uncached(user_input)
+    
+    @classmethod
+    @lru_cache(maxsize=2048)
+    def _check_input_cached(
+        cls, user_input: str
+    ) -> Tuple[bool, Optional[str], Optional[str], Optional[str]]:
+        """
+        Memoized check_input verdict as an immutable tuple.
+        Nothing is logged here (a cache hit would skip it); callers log blocks.
+        """
+        result = cls._check_input_uncached(user_input)
+        return result.is_safe, result.reason, result.sanitized_input, result.log_detail
+    
+    @classmethod
+    def _check_input_uncached(cls, user_input: str) -> GuardrailResult:
+        """Run every input check (patterns, special characters, length, sanitizing)."""
         if not user_input or not user_input.strip():
             return GuardrailResult(is_safe=True, sanitized_input="")
         
-        input_lower = user_input.lower()
-        
         # Check for injection patterns
-        for pattern in cls.INJECTION_PATTERNS:
-            if re.search(pattern, input_lower, re.IGNORECASE):
-                logger.warning(f"🛡️ Blocked injection attempt: {pattern}")
-                return GuardrailResult(
-                    is_safe=False,
-                    reason="I can't process requests that attempt to modify my instructions or behavior."
-                )
+        match = cls._INJECTION_RE.search(user_input)
+        if match:
+            pattern = cls.INJECTION_PATTERNS[int(match.lastgroup[1:])]
+            return GuardrailResult(
+                is_safe=False,
+                reason="I can't process requests that attempt to modify my instructions or behavior.",
+                log_detail=f"injection attempt: {pattern}"
+            )
         
         # Check for harmful content
-        for pattern in cls.HARMFUL_PATTERNS:
-            if re.search(pattern, input_lower, re.IGNORECASE):
-                logger.warning(f"🛡️ Blocked harmful content: {pattern}")
-                return GuardrailResult(
-                    is_safe=False,
-                    reason="I can't help with requests that could cause harm."
-                )
+        match = cls._HARMFUL_RE.search(user_input)
+        if match:
+            pattern = cls.HARMFUL_PATTERNS[int(match.lastgroup[1:])]
+            return GuardrailResult(
+                is_safe=False,
+                reason="I can't help with requests that could cause harm.",
+                log_detail=f"harmful content: {pattern}"
+            )
         
         # Check for excessive special characters (possible encoding attack)
-        special_char_ratio = sum(1 for c in user_input if not c.isalnum() and c not in ' .,?!-\'\"') / max(len(user_input), 1)
+        remainder = user_input.translate(cls._ALLOWED_TABLE)
+        if remainder.isascii():
+            special_count = len(remainder)
+        else:
+            # Non-ASCII letters/digits (accents, CJK, ...) still count as alphanumeric
+            special_count = sum(1 for c in remainder if not c.isalnum())
+        special_char_ratio = special_count / max(len(user_input), 1)
         if special_char_ratio > 0.5:
-            logger.warning("🛡️ Blocked: Excessive special characters")
             return GuardrailResult(
                 is_safe=False,
-                reason="Your message contains unusual formatting. Please rephrase your question."
+                reason="Your message contains unusual formatting. Please rephrase your question.",
+                log_detail="excessive special characters"
             )
         
         # Check for extremely long input (potential DoS)
         if len(user_input) > 10000:
-            logger.warning("🛡️ Blocked: Input too long")
             return GuardrailResult(
                 is_safe=False,
-                reason="Your message is too long. Please keep questions under 10,000 characters."
+                reason="Your message is too long. Please keep questions under 10,000 characters.",
+                log_detail="input too long"
             )
         
         # Sanitize input - remove potential control characters
@@ -147,17 +202,26 @@ class PromptGuardrails:
     def _sanitize_input(cls, text: str) -> str:
         """Remove potentially dangerous characters while preserving meaning."""
         # Remove null bytes and control characters (except newlines/tabs)
-        sanitized = re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]', '', text)
-        
-        # Normalize whitespace
-        sanitized = re.sub(r'\s+', ' ', sanitized).strip()
+        sanitized = text.translate(cls._CTRL_TABLE)
         
-        return sanitized
+        # Normalize whitespace (str.split() uses the same Unicode whitespace set as \s)
+        return " ".join(sanitized.split())
     
     # ==========================================================================
     # OUTPUT GUARDRAILS
     # ==========================================================================
     
+    # Phrases indicating the model is revealing its system prompt
+    SYSTEM_LEAK_PATTERNS = [
+        r"my\s+system\s+prompt\s+(is|says)",
+        r"my\s+instructions\s+(are|say)",
+        r"i\s+was\s+programmed\s+to",
+        r"my\s+initial\s+prompt",
+        r"here\s+(is|are)\s+my\s+instructions?",
+    ]
+    
+    _SYSTEM_LEAK_RE = _compile_union(SYSTEM_LEAK_PATTERNS, re.IGNORECASE)
+    
     @classmethod
     def check_output(cls, llm_output: str) -> GuardrailResult:
         """
@@ -169,24 +233,13 @@ class PromptGuardrails:
         if not llm_output:
             return GuardrailResult(is_safe=True, sanitized_input="")
         
-        output_lower = llm_output.lower()
-        
         # Check if model is revealing system prompt
-        system_leak_patterns = [
-            r"my\s+system\s+prompt\s+(is|says)",
-            r"my\s+instructions\s+(are|say)",
-            r"i\s+was\s+programmed\s+to",
-            r"my\s+initial\s+prompt",
-            r"here\s+(is|are)\s+my\s+instructions?",
-        ]
-        
-        for pattern in system_leak_patterns:
-            if re.search(pattern, output_lower):
-                logger.warning(f"🛡️ Blocked output: System prompt leak attempt")
-                return GuardrailResult(
-                    is_safe=False,
-                    reason="I'm designed to keep my internal instructions private."
-                )
+        if cls._SYSTEM_LEAK_RE.search(llm_output):
+            logger.warning(f"🛡️ Blocked output: System prompt leak attempt")
+            return GuardrailResult(
+                is_safe=False,
+                reason="I'm designed to keep my internal instructions private."
+            )
         
         return GuardrailResult(is_safe=True, sanitized_input=llm_output)
     
@@ -201,31 +254,32 @@ class PromptGuardrails:
         "purpose": "helping answer questions from documents",
     }
     
+    IDENTITY_PATTERNS = {
+        r"(what('s| is)|who('s| is))\s+your\s+name": 
+            f"I'm **{IDENTITY_FACTS['name']}**, a knowledge assistant created by {IDENTITY_FACTS['creator']}!",
+        
+        r"who\s+(created|made|built|developed)\s+(you|nexus)":
+            f"I was created by **{IDENTITY_FACTS['creator']}**! I'm here to help you find answers in your documents.",
+        
+        r"(what|who)\s+(are|is)\s+(you|nexus)":
+            f"I'm **{IDENTITY_FACTS['name']}**, a {IDENTITY_FACTS['type']} created by {IDENTITY_FACTS['creator']}. I specialize in {IDENTITY_FACTS['purpose']}.",
+        
+        r"are\s+you\s+(an?\s+)?(ai|artificial|robot|bot|gpt|chatgpt|claude)":
+            f"I'm {IDENTITY_FACTS['name']}, a knowledge assistant built by {IDENTITY_FACTS['creator']}. I'm designed to help you find information in your documents!",
+    }
+    
+    _IDENTITY_RE = _compile_union(list(IDENTITY_PATTERNS), re.IGNORECASE)
+    _IDENTITY_RESPONSES = list(IDENTITY_PATTERNS.values())
+    
     @classmethod
     def get_identity_response(cls, query: str) -> Optional[str]:
         """
         Return a consistent identity response if query is about the AI.
         Returns None if query is not about identity.
         """
-        query_lower = query.lower()
-        
-        identity_patterns = {
-            r"(what('s| is)|who('s| is))\s+your\s+name": 
-                f"I'm **{cls.IDENTITY_FACTS['name']}**, a knowledge assistant created by {cls.IDENTITY_FACTS['creator']}!",
-            
-            r"who\s+(created|made|built|developed)\s+(you|nexus)":
-                f"I was created by **{cls.IDENTITY_FACTS['creator']}**! I'm here to help you find answers in your documents.",
-            
-            r"(what|who)\s+(are|is)\s+(you|nexus)":
-                f"I'm **{cls.IDENTITY_FACTS['name']}**, a {cls.IDENTITY_FACTS['type']} created by {cls.IDENTITY_FACTS['creator']}. I specialize in {cls.IDENTITY_FACTS['purpose']}.",
-            
-            r"are\s+you\s+(an?\s+)?(ai|artificial|robot|bot|gpt|chatgpt|claude)":
-                f"I'm {cls.IDENTITY_FACTS['name']}, a knowledge assistant built by {cls.IDENTITY_FACTS['creator']}. I'm designed to help you find information in your documents!",
-        }
-        
-        for pattern, response in identity_patterns.items():
-            if re.search(pattern, query_lower):
-                return response
+        match = cls._IDENTITY_RE.search(query)
+        if match:
+            return cls._IDENTITY_RESPONSES[int(match.lastgroup[1:])]
         
         return None
 
@@ -248,6 +302,8 @@ def validate_input(user_input: str) -> Tuple[bool, str, Optional[str]]:
     if check.is_safe:
         return True, check.sanitized_input or user_input, None
     else:
+        # Logged per call, so repeated attempts (cached verdicts) still show up
+        logger.warning(f"🛡️ Blocked {check.log_detail}")
         return False, "", check.reason
 
 
@@ -1,5 +1,6 @@
 import os
 import uuid
+import asyncio
 import tempfile
 import logging
 from pathlib import Path
@@ -9,9 +10,8 @@ from dataclasses import dataclass
 # Document Loading
 from llama_index.core import SimpleDirectoryReader
 
-# Embeddings (CPU-optimized)
-from langchain_huggingface import HuggingFaceEmbeddings
-from fastembed import SparseTextEmbedding
+# Embeddings (CPU-optimized, shared with the query service)
+from src.services.embedders import get_dense_embedder, get_sparse_embedder
 
 # Text Splitting with Parent-Child Strategy
 from langchain_text_splitters import RecursiveCharacterTextSplitter
@@ -30,18 +30,26 @@ from qdrant_client.models import (
     PointStruct,
     SparseVector,
     NamedVector,
-    NamedSparseVector
+    NamedSparseVector,
+    PayloadSchemaType,
+    OptimizersConfigDiff,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType
 )
 
 from src.core.config import get_settings
 
 logger = logging.getLogger(__name__)
 
+# Read size used when copying uploads to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB
+
 # =============================================================================
 # CONFIGURATION
 # =============================================================================
 
-@dataclass
+@dataclass(slots=True)
 class HybridConfig:
     """Configuration for hybrid ingestion pipeline."""
     # Dense Embeddings (Semantic Search)
@@ -50,6 +58,7 @@ class HybridConfig:
     
     # Sparse Embeddings (Keyword Search) - Using Qdrant's optimized pruned SPLADE
     sparse_model: str = "Qdrant/bm42-all-minilm-l6-v2-attentions"  # Lighter than full SPLADE
+    sparse_batch_size: int = 64
     
     # Parent-Child Chunking
     parent_chunk_size: int = 2000
@@ -57,8 +66,13 @@ class HybridConfig:
     child_chunk_size: int = 400
     child_chunk_overlap: int = 50
     
-    # Device - CPU for embeddings to protect VRAM
-    device: str = "cpu"
+    # Children embedded + uploaded per pipeline step
+    embed_batch_size: int = 1024
+    
+    # Qdrant upload
+    upload_batch_size: int = 256
+    upload_parallel: int = 1  # >1 uploads from worker processes
+    indexing_threshold: int = 20000  # Qdrant default; set to 0 while bulk uploading
 
 
 # =============================================================================
@@ -79,22 +93,11 @@ class HybridIngestionService:
         
         logger.info("🚀 Initializing Hybrid Ingestion Service...")
         
-        # Initialize Dense Embeddings (Semantic - CPU)
-        logger.info(f"Loading Dense Embeddings: {self.config.dense_model} (device={self.config.device})")
-        self.dense_embedder = HuggingFaceEmbeddings(
-            model_name=self.config.dense_model,
-            model_kwargs={"device": self.config.device},
-            encode_kwargs={"normalize_embeddings": True}
-        )
-        
-        # Initialize Sparse Embeddings (Keyword - CPU)
-        logger.info(f"Loading Sparse Embeddings: {self.config.sparse_model}")
-        self.sparse_embedder = SparseTextEmbedding(
-            model_name=self.config.sparse_model,
-            # FastEmbed uses CPU by default
-        )
+        # Dense (semantic) and sparse (keyword) embeddings - CPU, shared per process
+        self.dense_embedder = get_dense_embedder(self.config.dense_model)
+        self.sparse_embedder = get_sparse_embedder(self.config.sparse_model)
         
-        # Text Splitters for Parent-Child
+        # Text Splitters for Parent-Child (built once, reused for every file)
         self.parent_splitter = RecursiveCharacterTextSplitter(
             chunk_size=self.config.parent_chunk_size,
             chunk_overlap=self.config.parent_chunk_overlap,
@@ -119,6 +122,10 @@ class HybridIngestionService:
             api_key=self.settings.QDRANT_API_KEY
         )
         
+        # Bulk uploads in flight per collection; HNSW indexing stays paused while any run
+        self._bulk_uploads: Dict[str, int] = {}
+        self._bulk_uploads_lock = asyncio.Lock()
+        
         logger.info("✅ Hybrid Ingestion Service initialized successfully!")
 
     def _ensure_collection_exists(self, collection_name: str):
@@ -141,11 +148,27 @@ class HybridIngestionService:
                 },
                 sparse_vectors_config={
                     "sparse": SparseVectorParams()
-                }
+                },
+                # int8 copies of dense vectors stay in RAM; originals are kept for rescoring
+                quantization_config=ScalarQuantization(
+                    scalar=ScalarQuantizationConfig(
+                        type=ScalarType.INT8,
+                        quantile=0.99,
+                        always_ram=True
+                    )
+                )
+            )
+            
+            # Keyword index on file_name for per-document facet counts and deletes
+            self.qdrant_client.create_payload_index(
+                collection_name=collection_name,
+                field_name="file_name",
+                field_schema=PayloadSchemaType.KEYWORD
             )
             logger.info(f"✅ Collection '{collection_name}' created with hybrid vectors!")
         else:
             logger.info(f"📁 Collection '{collection_name}' already exists")
+            self._restore_indexing_threshold(collection_name)
 
     def _extract_metadata(self, doc: Any, filename: str) -> Dict[str, Any]:
         """Extract rich metadata from document."""
@@ -184,7 +207,7 @@ class HybridIngestionService:
         parents = {}
         children = []
         
-        for doc in documents:
+        for doc_idx, doc in enumerate(documents):
             # Extract text content
             text = doc.get_content() if hasattr(doc, 'get_content') else str(doc)
             base_metadata = self._extract_metadata(doc, filename)
@@ -194,7 +217,9 @@ class HybridIngestionService:
             parent_texts = self.parent_splitter.split_text(text)
             
             for parent_idx, parent_text in enumerate(parent_texts):
-                parent_id = str(uuid.uuid4())
+                # Deterministic ids: re-ingesting the same file overwrites its parents
+                # (Postgres upsert) and children (Qdrant point ids) instead of duplicating them
+                parent_id = str(uuid.uuid5(uuid.NAMESPACE_OID, f"{team}:{filename}:{doc_idx}:{parent_idx}"))
                 
                 parent_metadata = {
                     **base_metadata,
@@ -230,32 +255,97 @@ class HybridIngestionService:
         logger.info(f"📄 Created {len(parents)} parents, {len(children)} children")
         return children, parents
 
-    def _generate_embeddings(self, texts: List[str]) -> tuple[List[List[float]], List[SparseVector]]:
+    def _embed_sparse(self, texts: List[str]) -> List[SparseVector]:
+        """
+        Generate sparse (keyword) vectors for texts.
+        
+        Runs in-process: FastEmbed's data-parallel mode would start a fresh worker
+        pool (one model load per core) for every pipeline batch, while the dense
+        ONNX session is already using all cores.
+        """
+        # Consume the generator directly; SparseVector needs plain lists, hence tolist()
+        return [
+            SparseVector(
+                indices=emb.indices.tolist(),
+                values=emb.values.tolist()
+            )
+            for emb in self.sparse_embedder.embed(
+                texts,
+                batch_size=self.config.sparse_batch_size
+            )
+        ]
+
+    async def _generate_embeddings(self, texts: List[str]) -> tuple[List[List[float]], List[SparseVector]]:
         """
         Generate both dense and sparse embeddings for texts.
         
+        The two models are independent and release the GIL during inference
+        (ONNX Runtime), so they run concurrently in worker threads.
+        
         Returns:
             - dense_vectors: List of dense embedding vectors
             - sparse_vectors: List of SparseVector objects
         """
         logger.info(f"🔢 Generating embeddings for {len(texts)} chunks...")
         
-        # Dense embeddings (batched)
-        dense_vectors = self.dense_embedder.embed_documents(texts)
-        
-        # Sparse embeddings (returns generator)
-        sparse_embeddings = list(self.sparse_embedder.embed(texts))
-        sparse_vectors = [
-            SparseVector(
-                indices=emb.indices.tolist(),
-                values=emb.values.tolist()
-            )
-            for emb in sparse_embeddings
-        ]
+        dense_vectors, sparse_vectors = await asyncio.gather(
+            asyncio.to_thread(self.dense_embedder.embed_documents, texts),
+            asyncio.to_thread(self._embed_sparse, texts)
+        )
         
         logger.info("✅ Embeddings generated successfully!")
         return dense_vectors, sparse_vectors
 
+    def _set_indexing_threshold(self, collection_name: str, threshold: int):
+        """Update the collection's HNSW indexing threshold (0 disables indexing)."""
+        self.qdrant_client.update_collection(
+            collection_name=collection_name,
+            optimizers_config=OptimizersConfigDiff(indexing_threshold=threshold)
+        )
+
+    def _restore_indexing_threshold(self, collection_name: str):
+        """Re-enable indexing left paused by an ingest that never finished (e.g. a crash)."""
+        if self._bulk_uploads.get(collection_name):
+            return
+        
+        info = self.qdrant_client.get_collection(collection_name)
+        if info.config.optimizer_config.indexing_threshold == 0:
+            logger.warning(f"⚠️ Indexing was left paused on '{collection_name}'; restoring it")
+            self._set_indexing_threshold(collection_name, self.config.indexing_threshold)
+
+    def restore_indexing_thresholds(self):
+        """Startup check: restore indexing on every team collection."""
+        try:
+            for collection in self.qdrant_client.get_collections().collections:
+                # Underscore-prefixed collections are internal (e.g. the answer cache)
+                if not collection.name.startswith("_"):
+                    self._restore_indexing_threshold(collection.name)
+        except Exception as e:
+            logger.warning(f"Could not verify indexing thresholds: {e}")
+
+    async def _begin_bulk_upload(self, collection_name: str):
+        """Pause indexing for the first of possibly concurrent ingests into a collection."""
+        async with self._bulk_uploads_lock:
+            count = self._bulk_uploads.get(collection_name, 0)
+            self._bulk_uploads[collection_name] = count + 1
+            if count == 0:
+                try:
+                    await asyncio.to_thread(self._set_indexing_threshold, collection_name, 0)
+                except Exception:
+                    del self._bulk_uploads[collection_name]
+                    raise
+
+    async def _end_bulk_upload(self, collection_name: str):
+        """Resume indexing once the last concurrent ingest into a collection finishes."""
+        async with self._bulk_uploads_lock:
+            count = self._bulk_uploads.pop(collection_name) - 1
+            if count:
+                self._bulk_uploads[collection_name] = count
+            else:
+                await asyncio.to_thread(
+                    self._set_indexing_threshold, collection_name, self.config.indexing_threshold
+                )
+
     def _index_to_qdrant(
         self,
         collection_name: str,
@@ -264,13 +354,10 @@ class HybridIngestionService:
         sparse_vectors: List[SparseVector]
     ):
         """Index child chunks with hybrid vectors into Qdrant."""
-        points = []
-        
-        for idx, (child, dense_vec, sparse_vec) in enumerate(
-            zip(children, dense_vectors, sparse_vectors)
-        ):
-            point = PointStruct(
-                id=str(uuid.uuid4()),
+        # Deterministic ids: retrying a failed upload overwrites points instead of duplicating them
+        points = [
+            PointStruct(
+                id=str(uuid.uuid5(uuid.NAMESPACE_OID, f"{child.metadata['parent_id']}:{child.metadata['child_index']}")),
                 vector={
                     "dense": dense_vec,
                     "sparse": sparse_vec
@@ -280,20 +367,54 @@ class HybridIngestionService:
                     **child.metadata
                 }
             )
-            points.append(point)
+            for child, dense_vec, sparse_vec in zip(children, dense_vectors, sparse_vectors)
+        ]
         
-        # Batch upsert
-        batch_size = 100
-        for i in range(0, len(points), batch_size):
-            batch = points[i:i + batch_size]
-            self.qdrant_client.upsert(
-                collection_name=collection_name,
-                points=batch
-            )
-            logger.info(f"📤 Indexed batch {i//batch_size + 1}/{(len(points)-1)//batch_size + 1}")
+        # Batched upload; the client streams batches and retries failed ones
+        self.qdrant_client.upload_points(
+            collection_name=collection_name,
+            points=points,
+            batch_size=self.config.upload_batch_size,
+            parallel=self.config.upload_parallel,
+            wait=True
+        )
         
         logger.info(f"✅ Indexed {len(points)} chunks to collection '{collection_name}'")
 
+    async def _embed_and_index(self, collection_name: str, children: List[Document]):
+        """
+        Embed and index child chunks as a two-stage pipeline over fixed-size batches.
+        
+        Only one batch of vectors is held at a time, and the Qdrant upload of
+        batch N runs in a worker thread while batch N+1 is being embedded.
+        """
+        batch_size = self.config.embed_batch_size
+        pending_upload = None
+        
+        # Pause HNSW indexing during the bulk upload so segments are indexed once
+        # at the end rather than rebuilt incrementally batch by batch
+        await self._begin_bulk_upload(collection_name)
+        try:
+            for i in range(0, len(children), batch_size):
+                batch = children[i:i + batch_size]
+                dense_vectors, sparse_vectors = await self._generate_embeddings(
+                    [c.page_content for c in batch]
+                )
+                
+                if pending_upload is not None:
+                    await pending_upload
+                pending_upload = asyncio.create_task(asyncio.to_thread(
+                    self._index_to_qdrant, collection_name, batch, dense_vectors, sparse_vectors
+                ))
+            
+            if pending_upload is not None:
+                await pending_upload
+        finally:
+            if pending_upload is not None and not pending_upload.done():
+                # Embedding failed mid-pipeline; let the in-flight upload settle first
+                await asyncio.gather(pending_upload, return_exceptions=True)
+            await self._end_bulk_upload(collection_name)
+
     async def ingest_file(
         self, 
         file_stream, 
@@ -321,19 +442,25 @@ class HybridIngestionService:
         with tempfile.TemporaryDirectory() as temp_dir:
             temp_file_path = os.path.join(temp_dir, filename)
             
-            # Write uploaded content
-            content = await file_stream.read()
-            with open(temp_file_path, "wb") as f:
-                f.write(content)
+            # Copy uploaded content in chunks so large files are never held in memory whole;
+            # disk I/O runs in worker threads so big uploads don't stall the event loop
+            f = await asyncio.to_thread(open, temp_file_path, "wb")
+            try:
+                while chunk := await file_stream.read(UPLOAD_CHUNK_SIZE):
+                    await asyncio.to_thread(f.write, chunk)
+            finally:
+                await asyncio.to_thread(f.close)
             
-            # Load documents using LlamaIndex (supports many formats)
+            # Load documents using LlamaIndex (supports many formats); parsing is blocking too
             reader = SimpleDirectoryReader(input_files=[temp_file_path])
-            documents = reader.load_data()
+            documents = await asyncio.to_thread(reader.load_data)
             
             logger.info(f"📖 Loaded {len(documents)} document(s) from {filename}")
         
-        # Create parent-child hierarchy
-        children, parents = self._create_parent_child_chunks(documents, filename, team)
+        # Create parent-child hierarchy (CPU-bound splitting, kept off the event loop)
+        children, parents = await asyncio.to_thread(
+            self._create_parent_child_chunks, documents, filename, team
+        )
         
         if not children:
             raise ValueError(f"No content extracted from {filename}")
@@ -343,12 +470,8 @@ class HybridIngestionService:
         await self.parent_store.store_batch(parent_items, team)
         await self.parent_cache.set_batch(parent_items)
         
-        # Generate hybrid embeddings
-        child_texts = [c.page_content for c in children]
-        dense_vectors, sparse_vectors = self._generate_embeddings(child_texts)
-        
-        # Index to Qdrant
-        self._index_to_qdrant(team, children, dense_vectors, sparse_vectors)
+        # Generate hybrid embeddings and index to Qdrant, batch by batch
+        await self._embed_and_index(team, children)
         
         result = {
             "status": "success",
@@ -377,6 +500,34 @@ class HybridIngestionService:
         
         return doc
 
+    async def get_parent_documents(self, parent_ids: List[str]) -> Dict[str, Document]:
+        """
+        Retrieve several parent documents at once.
+        Cache hits come from a single Redis MGET; misses are read from PostgreSQL
+        in one query and written back to the cache in one pipeline.
+        
+        Returns:
+            Dict mapping parent_id to Document (ids that were not found are omitted)
+        """
+        cached = await self.parent_cache.mget(parent_ids)
+        
+        documents = {}
+        missing = []
+        for parent_id, doc in zip(parent_ids, cached):
+            if doc is None:
+                missing.append(parent_id)
+            else:
+                documents[parent_id] = doc
+        
+        if missing:
+            # Cache miss - fall back to PostgreSQL and repopulate the cache
+            fetched = await self.parent_store.get_batch(missing)
+            if fetched:
+                await self.parent_cache.set_batch(list(fetched.items()))
+            documents.update(fetched)
+        
+        return documents
+
 
 # =============================================================================
 # SINGLETON INSTANCE (for use in API)
@@ -424,3 +575,11 @@ class IngestionService:
     async def get_parent_document(self, parent_id: str) -> Optional[Document]:
         """Get parent document for context expansion."""
         return await self._hybrid_service.get_parent_document(parent_id)
+    
+    def restore_indexing_thresholds(self):
+        """Re-enable indexing left paused by interrupted ingests."""
+        self._hybrid_service.restore_indexing_thresholds()
+    
+    async def get_parent_documents(self, parent_ids: List[str]) -> Dict[str, Document]:
+        """Get several parent documents for context expansion."""
+        return await self._hybrid_service.get_parent_documents(parent_ids)
@@ -1,6 +1,9 @@
 import logging
+import queue
+import threading
 from typing import Any, Optional
-from llama_cpp import Llama, LlamaGrammar
+import llama_cpp
+from llama_cpp import Llama, LlamaGrammar, LlamaRAMCache
 
 from llama_index.core.llms import (
     CustomLLM,
@@ -25,6 +28,15 @@ END_OF_TEXT = "\u003c|endoftext|\u003e"
 IM_START = "\u003c|im_start|\u003e"
 STOP_TOKENS = [IM_END, END_OF_TEXT]
 
+# Marks the end of a streamed generation in the token queue
+_STREAM_END = object()
+
+# KV cache element types selectable via LLM_KV_CACHE_TYPE
+KV_CACHE_TYPES = {
+    "f16": llama_cpp.GGML_TYPE_F16,
+    "q8_0": llama_cpp.GGML_TYPE_Q8_0,
+}
+
 
 class LocalQwenGPU(CustomLLM):
     """
@@ -35,6 +47,7 @@ class LocalQwenGPU(CustomLLM):
     num_output: int = 1024
     model_name: str = "Qwen2.5-3B-Instruct"
     _model: Any = None
+    _lock: Any = None
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -46,12 +59,39 @@ class LocalQwenGPU(CustomLLM):
 
         logger.info(f"Initializing Direct GPU Engine from: {model_path}")
         
+        # One llama.cpp context (KV cache, n_tokens, grammar state): every generation
+        # holds this lock from its first token to its last, so generations never interleave.
+        self._lock = threading.Lock()
+        
+        kv_type = KV_CACHE_TYPES.get(settings.LLM_KV_CACHE_TYPE)
+        if kv_type is None:
+            raise ValueError(
+                f"Unsupported LLM_KV_CACHE_TYPE '{settings.LLM_KV_CACHE_TYPE}'; "
+                f"expected one of: {', '.join(KV_CACHE_TYPES)}"
+            )
+        if kv_type != llama_cpp.GGML_TYPE_F16 and not settings.LLM_FLASH_ATTN:
+            # llama.cpp cannot quantize the V cache without flash attention
+            logger.warning("Quantized KV cache requires flash attention; falling back to f16")
+            kv_type = llama_cpp.GGML_TYPE_F16
+        
         self._model = Llama(
             model_path=model_path,
-            n_gpu_layers=-1,        
+            n_gpu_layers=settings.N_GPU_LAYERS,
             n_ctx=self.context_window,
+            n_batch=settings.LLM_N_BATCH,
+            n_ubatch=settings.LLM_N_UBATCH,
+            flash_attn=settings.LLM_FLASH_ATTN,
+            offload_kqv=settings.LLM_OFFLOAD_KQV,
+            type_k=kv_type,
+            type_v=kv_type,
             verbose=False           
         )
+        
+        # llama.cpp already reuses the live KV cache for a shared token prefix, but HyDE,
+        # contextualization and answer prompts alternate and evict each other. A RAM
+        # cache keeps saved states so the longest matching prefix is restored instead.
+        if settings.LLM_PROMPT_CACHE_MB > 0:
+            self._model.set_cache(LlamaRAMCache(capacity_bytes=settings.LLM_PROMPT_CACHE_MB << 20))
 
     @property
     def metadata(self) -> LLMMetadata:
@@ -79,7 +119,8 @@ class LocalQwenGPU(CustomLLM):
         if grammar is not None:
             llm_kwargs["grammar"] = grammar
             
-        response = self._model(prompt, **llm_kwargs)
+        with self._lock:
+            response = self._model(prompt, **llm_kwargs)
         text = response["choices"][0]["text"]
         return CompletionResponse(text=text)
 
@@ -97,10 +138,38 @@ class LocalQwenGPU(CustomLLM):
         if grammar is not None:
             llm_kwargs["grammar"] = grammar
             
-        response_iter = self._model(prompt, **llm_kwargs)
-        for response in response_iter:
-            text = response["choices"][0]["text"]
-            yield CompletionResponse(text=text, delta=text)
+        # The whole generation runs under the lock in a producer thread; tokens are
+        # handed over through a queue so a slow consumer never interleaves with
+        # another generation on the same context.
+        tokens: queue.Queue = queue.Queue()
+        cancelled = threading.Event()
+        
+        def produce():
+            try:
+                with self._lock:
+                    response_iter = self._model(prompt, **llm_kwargs)
+                    try:
+                        for response in response_iter:
+                            if cancelled.is_set():
+                                break
+                            tokens.put(response["choices"][0]["text"])
+                    finally:
+                        response_iter.close()
+            except Exception as e:
+                tokens.put(e)
+            finally:
+                tokens.put(_STREAM_END)
+        
+        threading.Thread(target=produce, name="llm-stream", daemon=True).start()
+        
+        try:
+            while (item := tokens.get()) is not _STREAM_END:
+                if isinstance(item, Exception):
+                    raise item
+                yield CompletionResponse(text=item, delta=item)
+        finally:
+            # Consumer went away (client disconnect): stop generating and free the lock
+            cancelled.set()
 
     @llm_chat_callback()
     def chat(self, messages: list[ChatMessage], grammar: Optional[LlamaGrammar] = None, **kwargs: Any) -> ChatResponse:
@@ -129,13 +198,9 @@ class LocalQwenGPU(CustomLLM):
             )
 
     def _messages_to_prompt(self, messages: list[ChatMessage]) -> str:
-        prompt = ""
-        for msg in messages:
-            role = msg.role.value
-            content = msg.content
-            prompt += f"{IM_START}{role}\n{content}{IM_END}\n"
-        prompt += f"{IM_START}assistant\n"
-        return prompt
+        parts = [f"{IM_START}{msg.role.value}\n{msg.content}{IM_END}\n" for msg in messages]
+        parts.append(f"{IM_START}assistant\n")
+        return "".join(parts)
 
 
 # --- Singleton Factory ---
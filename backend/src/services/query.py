@@ -6,21 +6,24 @@ Features:
 - Conversational Memory: Redis-backed session management
 - Step A: Query Contextualization (standalone question from history)
 - Step B: HyDE - Hypothetical Document Embeddings
-- Step C: Hybrid Search (0.7 dense + 0.3 sparse weighted fusion)
+- Step C: Hybrid Search (dense + sparse, server-side RRF fusion in Qdrant)
 - Step D: FlashRank Reranking (CPU-optimized)
 - Step E: Citation-enforced Generation with Qwen 2.5 (GPU Acceleration)
 - Context Truncation: 2500 tokens max before LLM
 =============================================================================
 """
 
+import asyncio
 import logging
+import threading
 import json
+import uuid
+from functools import lru_cache
 from typing import Dict, List, Optional, Any, AsyncGenerator
 from dataclasses import dataclass
 
-# Embeddings (CPU)
-from langchain_huggingface import HuggingFaceEmbeddings
-from fastembed import SparseTextEmbedding
+# Embeddings (CPU, shared with the ingestion service)
+from src.services.embedders import get_dense_embedder, get_sparse_embedder
 
 # Reranking (CPU)
 from flashrank import Ranker, RerankRequest
@@ -30,26 +33,36 @@ from qdrant_client import QdrantClient
 from qdrant_client.models import (
     SparseVector,
     Prefetch,
-    FusionQuery
+    FusionQuery,
+    Filter,
+    FieldCondition,
+    MatchValue,
+    VectorParams,
+    Distance,
+    PayloadSchemaType,
+    PointStruct,
+    Range
 )
 
 # Core Imports
 from llama_index.core.llms import ChatMessage, MessageRole
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_cpp import LlamaGrammar
 
 # INTERNAL IMPORTS
 from src.core.config import get_settings
-from src.core.grammar import FLEXIBLE_CITATION_GRAMMAR
+from src.core.grammar import get_compiled_llama_grammar
 from src.services.llm import LLMService
 from src.services.ingestion import get_ingestion_service
 from src.services.router import SemanticRouter
 from src.services.guardrails import PromptGuardrails, validate_input
 from src.services.citation_processor import ensure_citations
-from src.db.redis_cache import get_session_store
+from src.db.redis_cache import get_session_store, get_answer_cache
 
 logger = logging.getLogger(__name__)
 
+# Qdrant collection holding question vectors for the semantic answer cache.
+# The leading underscore keeps it out of the team list.
+ANSWER_CACHE_COLLECTION = "_query_cache"
+
 # =============================================================================
 # CONFIGURATION
 # =============================================================================
@@ -74,8 +87,14 @@ class HybridQueryConfig:
     # Context Limit (tokens)
     max_context_tokens: int = 2500
     
-    # Device
-    device: str = "cpu"
+    # HyDE
+    use_hyde: bool = True
+    hyde_min_words: int = 6     # Shorter questions are lookups; search them as written
+    hyde_cache_size: int = 256  # Hypothetical answers kept per process (0 disables)
+    
+    # Semantic answer cache
+    use_answer_cache: bool = True
+    answer_cache_threshold: float = 0.97  # Cosine similarity needed to reuse an answer
 
 
 # =============================================================================
@@ -141,19 +160,9 @@ class HybridQueryService:
         # LLM (GPU) - Using the Custom Bridge
         self.llm = LLMService.get_llm()
         
-        # Dense Embeddings (CPU)
-        logger.info(f"Loading Dense Embeddings: {self.config.dense_model}")
-        self.dense_embedder = HuggingFaceEmbeddings(
-            model_name=self.config.dense_model,
-            model_kwargs={"device": self.config.device},
-            encode_kwargs={"normalize_embeddings": True}
-        )
-        
-        # Sparse Embeddings (CPU)
-        logger.info(f"Loading Sparse Embeddings: {self.config.sparse_model}")
-        self.sparse_embedder = SparseTextEmbedding(
-            model_name=self.config.sparse_model
-        )
+        # Dense + Sparse Embeddings (CPU, shared per process)
+        self.dense_embedder = get_dense_embedder(self.config.dense_model)
+        self.sparse_embedder = get_sparse_embedder(self.config.sparse_model)
         
         # FlashRank Reranker (CPU)
         logger.info("Loading FlashRank Reranker...")
@@ -170,6 +179,10 @@ class HybridQueryService:
         # Session Memory (Redis-backed)
         self.memory_store = get_session_store()
         
+        # Semantic answer cache (question vectors in Qdrant, results in Redis)
+        self.answer_cache = get_answer_cache()
+        self._answer_cache_ready = False
+        
         # Ingestion service (for parent document retrieval)
         self.ingestion_service = get_ingestion_service()
         
@@ -178,6 +191,10 @@ class HybridQueryService:
         logger.info("Initializing Semantic Router...")
         self.router = SemanticRouter(embed_model=self.dense_embedder)
         
+        # HyDE answers memoized per normalized question (retries, repeated questions)
+        if self.config.hyde_cache_size > 0:
+            self._generate_hyde = lru_cache(maxsize=self.config.hyde_cache_size)(self._generate_hyde)
+        
         logger.info("✅ Hybrid Query Service initialized!")
 
     # =========================================================================
@@ -203,7 +220,8 @@ class HybridQueryService:
             ChatMessage(role=MessageRole.USER, content=prompt)
         ]
         
-        response = self.llm.chat(messages)
+        # Blocking llama.cpp call (may wait on another generation's lock): keep it off the loop
+        response = await asyncio.to_thread(self.llm.chat, messages)
         standalone_question = str(response.message.content).strip()
         
         logger.info(f"📝 Contextualized: '{query}' → '{standalone_question}'")
@@ -230,23 +248,72 @@ class HybridQueryService:
         logger.info(f"🔮 HyDE generated: {hyde_answer[:100]}...")
         return hyde_answer
 
+    async def _get_search_text(self, question: str) -> str:
+        """
+        Pick the text to embed for retrieval.
+        
+        Short lookup-style questions ("server OS version?") already share vocabulary
+        with the documents, so HyDE's extra LLM generation is skipped for them.
+        Longer questions are expanded with a (cached) hypothetical answer.
+        """
+        words = question.split()
+        if not self.config.use_hyde or len(words) < self.config.hyde_min_words:
+            logger.info("🔎 Skipping HyDE for lookup query")
+            return question
+        
+        return await asyncio.to_thread(self._generate_hyde, " ".join(words))
+
     # =========================================================================
     # STEP C: HYBRID SEARCH
     # =========================================================================
     
+    def _embed_sparse_query(self, query_text: str) -> SparseVector:
+        """Generate the sparse (keyword) vector for a query."""
+        sparse_embedding = list(self.sparse_embedder.embed([query_text]))[0]
+        return SparseVector(
+            indices=sparse_embedding.indices.tolist(),
+            values=sparse_embedding.values.tolist()
+        )
+    
     def _hybrid_search(self, query_text: str, collection_name: str) -> List[Dict[str, Any]]:
         """
         Perform hybrid search combining dense and sparse vectors.
         """
         # Generate embeddings for the query
         dense_vector = self.dense_embedder.embed_query(query_text)
+        sparse_vector = self._embed_sparse_query(query_text)
         
-        sparse_embedding = list(self.sparse_embedder.embed([query_text]))[0]
-        sparse_vector = SparseVector(
-            indices=sparse_embedding.indices.tolist(),
-            values=sparse_embedding.values.tolist()
-        )
+        return self._search_points(dense_vector, sparse_vector, collection_name)
+    
+    async def _hybrid_search_async(
+        self,
+        query_text: str,
+        collection_name: str,
+        dense_vector: Optional[List[float]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Async variant of _hybrid_search.
+        Dense and sparse query embeddings run concurrently in worker threads,
+        and the Qdrant call is kept off the event loop. A precomputed dense
+        vector for query_text (e.g. from the answer cache lookup) is reused.
+        """
+        if dense_vector is None:
+            dense_vector, sparse_vector = await asyncio.gather(
+                asyncio.to_thread(self.dense_embedder.embed_query, query_text),
+                asyncio.to_thread(self._embed_sparse_query, query_text)
+            )
+        else:
+            sparse_vector = await asyncio.to_thread(self._embed_sparse_query, query_text)
         
+        return await asyncio.to_thread(self._search_points, dense_vector, sparse_vector, collection_name)
+    
+    def _search_points(
+        self,
+        dense_vector: List[float],
+        sparse_vector: SparseVector,
+        collection_name: str
+    ) -> List[Dict[str, Any]]:
+        """Run the fused dense + sparse query against Qdrant."""
         # Hybrid search using Qdrant's prefetch + RRF fusion
         results = self.qdrant_client.query_points(
             collection_name=collection_name,
@@ -295,14 +362,19 @@ class HybridQueryService:
         parent_docs = []
         seen_parent_ids = set()
         
+        # Fetch all parents up front (one Redis MGET, PostgreSQL for misses)
+        parent_ids = list(dict.fromkeys(
+            child["parent_id"] for child in child_results if child.get("parent_id")
+        ))
+        parents = await self.ingestion_service.get_parent_documents(parent_ids)
+        
         for child in child_results:
             parent_id = child.get("parent_id")
             
             if parent_id and parent_id not in seen_parent_ids:
                 seen_parent_ids.add(parent_id)
                 
-                # Try to get parent from Redis cache / PostgreSQL
-                parent_doc = await self.ingestion_service.get_parent_document(parent_id)
+                parent_doc = parents.get(parent_id)
                 
                 if parent_doc:
                     parent_docs.append({
@@ -395,10 +467,66 @@ class HybridQueryService:
         
         return full_context
 
+    # =========================================================================
+    # PROVENANCE
+    # =========================================================================
+    
+    def _build_provenance(self, documents: List[Dict[str, Any]], max_chars: int = 500) -> List[Dict[str, Any]]:
+        """
+        Build the source list returned to the client.
+        Document text is truncated to max_chars.
+        """
+        provenance = []
+        for doc in documents:
+            text = doc.get("text", "")
+            if len(text) > max_chars:
+                text = text[:max_chars] + "..."
+            
+            provenance.append({
+                "file_name": doc.get("file_name", doc.get("source", "Unknown")),
+                "text": text,
+                "page": str(doc.get("page", "")),
+                "score": float(doc.get("rerank_score", doc.get("score", 0)))
+            })
+        
+        return provenance
+
     # =========================================================================
     # STEP E: GENERATION WITH CITATIONS
     # =========================================================================
     
+    @staticmethod
+    async def _iterate_in_thread(iterator) -> AsyncGenerator[Any, None]:
+        """
+        Drain a blocking iterator (llama.cpp token stream) from a worker thread.
+        
+        Each next() runs via asyncio.to_thread, so token decoding never blocks
+        the event loop and other requests keep being served between tokens.
+        If the consumer goes away (client disconnect), the iterator is closed
+        right away so the generation stops and releases the model.
+        """
+        sentinel = object()
+        iterator = iter(iterator)
+        # A generator can't be closed while a next() is running in it, so steps
+        # and close() are serialized; close() waits for an in-flight next()
+        step_lock = threading.Lock()
+        
+        def step():
+            with step_lock:
+                return next(iterator, sentinel)
+        
+        def close():
+            with step_lock:
+                if hasattr(iterator, "close"):
+                    iterator.close()
+        
+        try:
+            while (item := await asyncio.to_thread(step)) is not sentinel:
+                yield item
+        finally:
+            # Shielded: a repeated cancellation must not skip the close
+            await asyncio.shield(asyncio.to_thread(close))
+    
     def _generate_answer(self, question: str, context: str, use_grammar: bool = False) -> str:
         """
         Generate answer using Qwen with citation enforcement and optional grammar constraints.
@@ -419,7 +547,7 @@ class HybridQueryService:
         grammar = None
         if use_grammar:
             try:
-                grammar = LlamaGrammar.from_string(FLEXIBLE_CITATION_GRAMMAR)
+                grammar = get_compiled_llama_grammar(strict=False)
                 logger.info("Using grammar-constrained generation")
             except Exception as e:
                 logger.warning(f"Failed to load grammar, using unconstrained generation: {e}")
@@ -446,14 +574,14 @@ class HybridQueryService:
         grammar = None
         if use_grammar:
             try:
-                grammar = LlamaGrammar.from_string(FLEXIBLE_CITATION_GRAMMAR)
+                grammar = get_compiled_llama_grammar(strict=False)
                 logger.info("Using grammar-constrained streaming")
             except Exception as e:
                 logger.warning(f"Failed to load grammar for streaming: {e}")
         
         response = self.llm.stream_chat(messages, grammar=grammar)
         
-        for token in response:
+        async for token in self._iterate_in_thread(response):
             yield token.delta
 
     # =========================================================================
@@ -479,7 +607,7 @@ class HybridQueryService:
         else:
             messages.append(ChatMessage(role=MessageRole.USER, content=query))
         
-        response = self.llm.chat(messages)
+        response = await asyncio.to_thread(self.llm.chat, messages)
         return str(response.message.content).strip()
     
     async def _generate_chitchat_stream(self, query: str, session_id: str):
@@ -502,8 +630,161 @@ class HybridQueryService:
             messages.append(ChatMessage(role=MessageRole.USER, content=query))
         
         response = self.llm.stream_chat(messages)
-        for token in response:
-            yield token.delta              
+        async for token in self._iterate_in_thread(response):
+            yield token.delta
+    
+    # =========================================================================
+    # WARMUP
+    # =========================================================================
+    
+    def warmup(self):
+        """
+        Push one throwaway query through both embedders so the first user request
+        doesn't pay for lazy initialization (thread pools, ONNX sessions).
+        """
+        self.dense_embedder.embed_query("warmup")
+        self._embed_sparse_query("warmup")
+        logger.info("🔥 Embedders warmed up")
+    
+    # =========================================================================
+    # SEMANTIC ANSWER CACHE
+    # =========================================================================
+    
+    def _ensure_answer_cache_collection(self, dimension: int):
+        """Create the answer cache collection on first use."""
+        if self._answer_cache_ready:
+            return
+        
+        if not self.qdrant_client.collection_exists(ANSWER_CACHE_COLLECTION):
+            logger.info(f"📦 Creating answer cache collection: {ANSWER_CACHE_COLLECTION}")
+            self.qdrant_client.create_collection(
+                collection_name=ANSWER_CACHE_COLLECTION,
+                vectors_config=VectorParams(size=dimension, distance=Distance.COSINE)
+            )
+            self.qdrant_client.create_payload_index(
+                collection_name=ANSWER_CACHE_COLLECTION,
+                field_name="team",
+                field_schema=PayloadSchemaType.KEYWORD
+            )
+            self.qdrant_client.create_payload_index(
+                collection_name=ANSWER_CACHE_COLLECTION,
+                field_name="generation",
+                field_schema=PayloadSchemaType.INTEGER
+            )
+        self._answer_cache_ready = True
+    
+    @staticmethod
+    def _team_filter(team: str, generation: Optional[int] = None, older: bool = False) -> Filter:
+        """Match a team's entries: from one generation, or (older=True) from before it."""
+        conditions = [FieldCondition(key="team", match=MatchValue(value=team))]
+        if generation is not None:
+            if older:
+                conditions.append(FieldCondition(key="generation", range=Range(lt=generation)))
+            else:
+                conditions.append(FieldCondition(key="generation", match=MatchValue(value=generation)))
+        return Filter(must=conditions)
+    
+    async def _lookup_cached_answer(
+        self, question: str, team: str
+    ) -> tuple[Optional[Dict[str, Any]], Optional[List[float]], Optional[int]]:
+        """
+        Find a previously answered question for this team that is nearly identical.
+        
+        Only entries from the team's current generation match. The generation is
+        read before retrieval, so an answer built from documents that change
+        mid-query is stored under a generation that is already retired.
+        
+        Returns:
+            (cached result or None, question vector, generation) - the last two
+            are needed to store the new answer
+        """
+        if not self.config.use_answer_cache:
+            return None, None, None
+        
+        try:
+            generation = await self.answer_cache.get_generation(team)
+            vector = await asyncio.to_thread(self.dense_embedder.embed_query, question)
+            await asyncio.to_thread(self._ensure_answer_cache_collection, len(vector))
+            
+            response = await asyncio.to_thread(
+                self.qdrant_client.query_points,
+                collection_name=ANSWER_CACHE_COLLECTION,
+                query=vector,
+                query_filter=self._team_filter(team, generation),
+                limit=1,
+                score_threshold=self.config.answer_cache_threshold
+            )
+            if response.points:
+                hit = response.points[0]
+                cached = await self.answer_cache.get(str(hit.id))
+                if cached:
+                    logger.info(f"⚡ Answer cache hit (similarity={hit.score:.3f})")
+                    return cached, vector, generation
+            
+            return None, vector, generation
+        except Exception as e:
+            # The cache is an optimization; never fail a query because of it.
+            # Re-check the collection next time in case it was removed.
+            self._answer_cache_ready = False
+            logger.warning(f"Answer cache lookup failed: {e}")
+            return None, None, None
+    
+    async def _store_cached_answer(
+        self,
+        question: str,
+        team: str,
+        vector: Optional[List[float]],
+        generation: Optional[int],
+        result: Dict[str, Any]
+    ):
+        """Remember a freshly generated result for similar future questions."""
+        if vector is None or generation is None:
+            return
+        
+        try:
+            # Same question, team and generation -> same point, so re-asks overwrite
+            entry_id = str(uuid.uuid5(
+                uuid.NAMESPACE_OID, f"{team}:{generation}:{' '.join(question.split())}"
+            ))
+            
+            # Write the answer before the vector so a vector hit always finds its answer
+            await self.answer_cache.set(entry_id, result)
+            await asyncio.to_thread(
+                self.qdrant_client.upsert,
+                collection_name=ANSWER_CACHE_COLLECTION,
+                points=[PointStruct(
+                    id=entry_id,
+                    vector=vector,
+                    payload={"team": team, "generation": generation, "question": question}
+                )],
+                wait=False
+            )
+        except Exception as e:
+            self._answer_cache_ready = False
+            logger.warning(f"Answer cache store failed: {e}")
+    
+    async def invalidate_answer_cache(self, team: str):
+        """
+        Forget cached answers for a team (call after its documents change).
+        
+        Bumping the generation retires every existing entry at once, including
+        answers still being generated from the old documents. Deleting the old
+        question vectors from Qdrant afterwards is only cleanup.
+        """
+        try:
+            generation = await self.answer_cache.bump_generation(team)
+            logger.info(f"🗑️ Invalidated answer cache for team: {team} (generation {generation})")
+            
+            if await asyncio.to_thread(self.qdrant_client.collection_exists, ANSWER_CACHE_COLLECTION):
+                await asyncio.to_thread(
+                    self.qdrant_client.delete,
+                    collection_name=ANSWER_CACHE_COLLECTION,
+                    points_selector=self._team_filter(team, generation, older=True),
+                    wait=False
+                )
+        except Exception as e:
+            self._answer_cache_ready = False
+            logger.warning(f"Answer cache invalidation failed for team {team}: {e}")
     
     # =========================================================================
     # MAIN QUERY METHOD
@@ -526,33 +807,37 @@ class HybridQueryService:
         
         # RAG Mode
         standalone_question = await self._contextualize_query(query, session_id)
-        hyde_answer = self._generate_hyde(standalone_question)
-        child_results = self._hybrid_search(hyde_answer, team)
+        
+        cached, question_vector, cache_generation = await self._lookup_cached_answer(standalone_question, team)
+        if cached:
+            await self.memory_store.add_message(session_id, "user", query)
+            await self.memory_store.add_message(session_id, "assistant", cached["answer"])
+            return cached
+        
+        search_text = await self._get_search_text(standalone_question)
+        # Without HyDE the search text is the question already embedded for the cache lookup
+        dense_vector = question_vector if search_text == standalone_question else None
+        child_results = await self._hybrid_search_async(search_text, team, dense_vector)
         parent_docs = await self._fetch_parent_documents(child_results)
         reranked_docs = self._rerank_documents(standalone_question, parent_docs)
         context = self._format_context(reranked_docs)
-        answer = self._generate_answer(standalone_question, context)
+        answer = await asyncio.to_thread(self._generate_answer, standalone_question, context)
         
         await self.memory_store.add_message(session_id, "user", query)
         await self.memory_store.add_message(session_id, "assistant", answer)
         
-        provenance = [
-            {
-                "file_name": doc.get("file_name", doc.get("source", "Unknown")),
-                "text": doc.get("text", "")[:500] + "..." if len(doc.get("text", "")) > 500 else doc.get("text", ""),
-                "page": str(doc.get("page", "")),
-                "score": float(doc.get("rerank_score", doc.get("score", 0)))
-            }
-            for doc in reranked_docs
-        ]
+        provenance = self._build_provenance(reranked_docs)
         
         # Post-process to ensure all sentences have citations
         answer = ensure_citations(answer, provenance)
         
-        return {
+        result = {
             "answer": answer,
             "provenance": provenance
         }
+        await self._store_cached_answer(standalone_question, team, question_vector, cache_generation, result)
+        
+        return result
     
     async def stream_query(self, query: str, team: str, session_id: str) -> AsyncGenerator[str, None]:
         """
@@ -597,8 +882,19 @@ class HybridQueryService:
         
         # RAG Mode
         standalone_question = await self._contextualize_query(query, session_id)
-        hyde_answer = self._generate_hyde(standalone_question)
-        child_results = self._hybrid_search(hyde_answer, team)
+        
+        cached, question_vector, cache_generation = await self._lookup_cached_answer(standalone_question, team)
+        if cached:
+            yield cached["answer"]
+            await self.memory_store.add_message(session_id, "user", query)
+            await self.memory_store.add_message(session_id, "assistant", cached["answer"])
+            yield f"\n\n__PROVENANCE_START__\n{json.dumps({'provenance': cached['provenance']})}\n__PROVENANCE_END__"
+            return
+        
+        search_text = await self._get_search_text(standalone_question)
+        # Without HyDE the search text is the question already embedded for the cache lookup
+        dense_vector = question_vector if search_text == standalone_question else None
+        child_results = await self._hybrid_search_async(search_text, team, dense_vector)
         parent_docs = await self._fetch_parent_documents(child_results)
         reranked_docs = self._rerank_documents(standalone_question, parent_docs)
         context = self._format_context(reranked_docs)
@@ -612,17 +908,15 @@ class HybridQueryService:
         await self.memory_store.add_message(session_id, "user", query)
         await self.memory_store.add_message(session_id, "assistant", full_response)
         
-        provenance = [
-            {
-                "file_name": doc.get("file_name", doc.get("source", "Unknown")),
-                "text": doc.get("text", "")[:500] + "..." if len(doc.get("text", "")) > 500 else doc.get("text", ""),
-                "page": str(doc.get("page", "")),
-                "score": float(doc.get("rerank_score", doc.get("score", 0)))
-            }
-            for doc in reranked_docs
-        ]
+        provenance = self._build_provenance(reranked_docs)
         
         yield f"\n\n__PROVENANCE_START__\n{json.dumps({'provenance': provenance})}\n__PROVENANCE_END__"
+        
+        # Cache the same citation-checked answer /query/ would return
+        await self._store_cached_answer(
+            standalone_question, team, question_vector, cache_generation,
+            {"answer": ensure_citations(full_response, provenance), "provenance": provenance}
+        )
     
     async def clear_session(self, session_id: str):
         """Clear session history."""
@@ -660,4 +954,10 @@ class QueryService:
             yield token
     
     async def clear_session(self, session_id: str):
-        await self._hybrid_service.clear_session(session_id)
\ No newline at end of file
+        await self._hybrid_service.clear_session(session_id)
+    
+    async def invalidate_answer_cache(self, team: str):
+        await self._hybrid_service.invalidate_answer_cache(team)
+    
+    def warmup(self):
+        self._hybrid_service.warmup()
\ No newline at end of file
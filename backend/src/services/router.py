@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import numpy as np
 from typing import List, Dict, Any
@@ -59,8 +60,8 @@ class SemanticRouter:
         """
         Route the query to 'chat' or 'rag' based on semantic similarity.
         """
-        # Use LangChain-style embed_query (synchronous)
-        query_embedding = self.embed_model.embed_query(query)
+        # embed_query is synchronous and CPU-bound; keep it off the event loop
+        query_embedding = await asyncio.to_thread(self.embed_model.embed_query, query)
 
         max_similarity = -1.0
 